@@ -6,6 +6,9 @@ Run (recommended):
 Or run directly (will start uvicorn):
   python Local_Ai.py
 
+Multi-process (CPU-bound validation/serialization scales across cores):
+  LOCALAPI_WORKERS=4 python Local_Ai.py
+
 Env sample (.env):
   LOCALAPI_DATABASE_PATH=data/local_api.db
   LOCALAPI_LLM_BASE_URL=http://192.168.0.111:1234/v1
@@ -32,33 +35,33 @@ __all__ = ["app"]
 
 if __name__ == "__main__":
     # Allow running as: python Local_Ai.py
+    # app.api (imported above) already loaded settings and the app package, so no fallbacks needed
     import uvicorn
-    import logging
-    try:
-        from app.config import get_settings
-        from app.log_setup import build_uvicorn_log_config  # type: ignore
-    except Exception:
-        get_settings = None  # type: ignore
-        build_uvicorn_log_config = None  # type: ignore
+    from app.config import get_settings
+    from app.log_setup import build_uvicorn_log_config
 
-    # Optional: filter /health from uvicorn access logs when running via this entrypoint
-    class _HealthFilter(logging.Filter):
-        def filter(self, record: logging.LogRecord) -> bool:  # noqa: D401
-            try:
-                msg = record.getMessage()
-            except Exception:  # noqa: BLE001
-                msg = str(getattr(record, "msg", ""))
-            return "/health" not in msg
-
-    logging.getLogger("uvicorn.access").addFilter(_HealthFilter())
+    s = get_settings()
 
+    # Prefer uvloop when available (not shipped for Windows); fall back to asyncio
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    # C HTTP parser (httptools) instead of pure-Python h11, when installed
     try:
-        s = get_settings() if get_settings else None
-        host = getattr(s, "api_host", "0.0.0.0") if s else "0.0.0.0"
-        port = int(getattr(s, "api_port", 8080)) if s else 8080
-    except Exception:
-        host = "0.0.0.0"
-        port = 8080
+        import httptools  # noqa: F401
+        http = "httptools"
+    except ImportError:
+        http = "h11"
 
-    log_config = build_uvicorn_log_config() if build_uvicorn_log_config else None
-    uvicorn.run("Local_Ai:app", host=host, port=port, log_config=log_config)
+    uvicorn.run(
+        "Local_Ai:app",
+        host=s.api_host,
+        port=s.api_port,
+        loop=loop,
+        http=http,
+        ws="websockets",
+        workers=s.workers,
+        log_config=build_uvicorn_log_config(),
+    )
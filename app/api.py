@@ -15,76 +15,112 @@ from __future__ import annotations
 
 import uuid as _uuid
 import orjson
-from typing import Any
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
 from pathlib import Path
 import asyncio
+import re
+import stat
 import time
 
-import httpx
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import ORJSONResponse, FileResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
+from pydantic import TypeAdapter, ValidationError
 
 from .config import get_settings
 from .db import Database
-from .llm_client import LLMClient
+from .llm_client import LLMClient, backoff_delay
 from .logging_utils import log_error, log_info, print_banner
 from .models import ResponsePayload, ResponseRequest
 from .service import LocalResponsesService
-from . import summarizer
+from . import summarizer, tooling
 from .ui import router as ui_router
 from .ws import router as ws_router
 
 
-class ORJSONResponse2(ORJSONResponse):
-    media_type = "application/json"
+# Payloads here always have str keys and no numpy values, so skip the OPT_NON_STR_KEYS /
+# OPT_SERIALIZE_NUMPY slow path of fastapi's ORJSONResponse. UUIDs are native in orjson 3;
+# naive datetimes (if any appear) are tagged UTC without a Python default= callback.
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC
 
+
+class FastORJSONResponse(ORJSONResponse):
     def render(self, content: Any) -> bytes:  # type: ignore[override]
-        return orjson.dumps(content)
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+SCHEMA_PATH = Path(__file__).resolve().parent.parent / "schema.sql"
+# Plain file names only (no separators, no leading dot -> no "..", no hidden upload temps)
+FILE_ID_RE = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9._-]{0,127}$")
+# Uploader stores content-addressed names (<sha256><suffix>): their bytes never change
+CONTENT_ADDRESSED_RE = re.compile(r"^[0-9a-f]{64}(\.[A-Za-z0-9]+)?$")
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+# Built once: parses and validates raw JSON bytes in pydantic-core, no intermediate dict in Python
+_RESPONSE_REQUEST_ADAPTER = TypeAdapter(ResponseRequest)
+
+
+def _parse_response_request(body: bytes) -> ResponseRequest:
+    try:
+        return _RESPONSE_REQUEST_ADAPTER.validate_json(body)
+    except ValidationError as e:
+        errors = e.errors(include_url=False, include_context=False)
+        for err in errors:
+            err["loc"] = ("body", *err["loc"])
+        raise RequestValidationError(errors)
+
+
+# Body is decoded manually above; keep the request schema in OpenAPI
+_RESPONSE_REQUEST_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": ResponseRequest.model_json_schema()}},
+    }
+}
 
 
 def create_app() -> FastAPI:
     settings = get_settings()
-    app = FastAPI(title="Local Responses API", default_response_class=ORJSONResponse2)
-
-    # Static files (for favicon and future assets)
     static_dir = Path(__file__).resolve().parent / "static"
-    if static_dir.exists():
-        app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 
-    app.include_router(ui_router)
-    app.include_router(ws_router)
+    # Settings are fixed for the process lifetime: bind what handlers need once
+    # Resolved once; uploader writes into the same configured files_dir
+    files_base = Path(settings.files_dir).resolve()
+    llm_base = settings.llm_base_url.rstrip("/")
+    llm_model = settings.llm_model
 
-    db = Database(settings.database_path)
+    db = Database(settings.database_path, readers=settings.db_readers)
     llm = LLMClient()
     service = LocalResponsesService(db, llm)
 
-    # expose service to ws router via app.state
-    app.state.service = service
-    app.state.llm_online = False
-
-    @app.get("/favicon.ico", include_in_schema=False)
-    async def favicon() -> FileResponse:
-        path = static_dir / "favicon.ico"
-        if not path.is_file():
-            # Fallback: 404 if icon missing
-            raise HTTPException(status_code=404, detail="favicon not found")
-        return FileResponse(str(path))
-
-    @app.on_event("startup")
-    async def _startup() -> None:
-        await db.connect()
-        # Apply schema.sql so required tables exist
+    async def _apply_schema() -> None:
+        # Apply schema.sql so required tables exist (skipped when unchanged since last boot)
         try:
-            schema_path = Path(__file__).resolve().parent.parent / "schema.sql"
-            schema_sql = schema_path.read_text(encoding="utf-8")
-            await db.executescript(schema_sql)
+            schema_path = SCHEMA_PATH
+            # Off the event loop so the read overlaps with the concurrent LLM probe
+            schema_sql = await asyncio.to_thread(schema_path.read_text, encoding="utf-8")
+            schema_applied = await db.apply_schema(schema_sql)
             log_info(
                 "startup",
                 message="Local AI service started",
                 db_path=db.path,
                 llm_url=settings.llm_base_url,
                 schema_path=str(schema_path),
+                schema_applied=schema_applied,
                 chat_model=settings.llm_model,
                 vision_model=settings.vision_model,
                 max_upload_mb=settings.max_upload_mb,
@@ -105,27 +141,28 @@ def create_app() -> FastAPI:
         except Exception as e:  # noqa: BLE001
             log_error("schema_error", message="Failed to apply schema.sql", error=str(e))
             raise
-        # Probe LLM connectivity (GET /models) with retries
-        base = settings.llm_base_url.rstrip("/")
-        url = f"{base}/models"
+
+    async def _probe_llm(app: FastAPI) -> None:
+        # Probe LLM connectivity (GET /models) with retries; never raises.
+        # Uses the LLM client's probe pool (no transport retries): each attempt fails within its timeout.
+        base = llm_base
         last_err: Exception | None = None
-        for attempt in range(1, 4):
-            t0 = time.perf_counter()
+        attempts = 3
+        for attempt in range(1, attempts + 1):
+            t0 = time.perf_counter_ns()
             try:
-                async with httpx.AsyncClient(timeout=5.0) as client:
-                    resp = await client.get(url)
-                    resp.raise_for_status()
-                    data = resp.json()
+                data = await llm.list_models(timeout=5.0)
                 n_models = len(data.get("data", [])) if isinstance(data, dict) else None
-                dt_ms = int((time.perf_counter() - t0) * 1000)
+                dt_ms = (time.perf_counter_ns() - t0) // 1_000_000
                 log_info("llm_probe_success", base_url=base, latency_ms=dt_ms, models_count=n_models, message="LLM connection established")
                 app.state.llm_online = True
                 break
             except Exception as e:  # noqa: BLE001
                 last_err = e
-                dt_ms = int((time.perf_counter() - t0) * 1000)
+                dt_ms = (time.perf_counter_ns() - t0) // 1_000_000
                 log_error("llm_probe_error", base_url=base, latency_ms=dt_ms, attempt=attempt, error=f"{type(e).__name__}: {str(e)}")
-                await asyncio.sleep(0.25 * (2 ** (attempt - 1)))
+                if attempt < attempts:
+                    await asyncio.sleep(backoff_delay(attempt))
         if not app.state.llm_online:
             log_error("llm_unavailable", base_url=base, error=str(last_err) if last_err else "unknown")
             print_banner(
@@ -135,15 +172,47 @@ def create_app() -> FastAPI:
                     "Проверьте адрес/порт, доступность LM Studio и значения переменных окружения.",
                 ],
             )
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        await db.connect()
+        # Schema apply (disk + SQLite) and LLM probe (network) are independent -> overlap them;
+        # a schema failure cancels the probe and aborts startup
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(_apply_schema())
+            tg.create_task(_probe_llm(app))
         # Init summarizer module
         summarizer.init(db, llm)
+        try:
+            yield
+        finally:
+            await summarizer.shutdown()
+            await llm.aclose()
+            await tooling.aclose_client()
+            await db.close()
+            log_info("shutdown", message="Service stopped")
+            print_banner("Local AI — сервер остановлен", [])
+
+    app = FastAPI(title="Local Responses API", default_response_class=FastORJSONResponse, lifespan=lifespan)
+
+    # Static files (for favicon and future assets)
+    if static_dir.exists():
+        app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 
-    @app.on_event("shutdown")
-    async def _shutdown() -> None:
-        await llm.aclose()
-        await db.close()
-        log_info("shutdown", message="Service stopped")
-        print_banner("Local AI — сервер остановлен", [])
+    app.include_router(ui_router)
+    app.include_router(ws_router)
+
+    # expose service to ws router via app.state
+    app.state.service = service
+    app.state.llm_online = False
+
+    @app.get("/favicon.ico", include_in_schema=False)
+    async def favicon() -> FileResponse:
+        path = static_dir / "favicon.ico"
+        if not path.is_file():
+            # Fallback: 404 if icon missing
+            raise HTTPException(status_code=404, detail="favicon not found")
+        return FileResponse(str(path))
 
     @app.get("/health")
     async def get_health() -> dict[str, Any]:
@@ -155,16 +224,11 @@ def create_app() -> FastAPI:
             ok_db = False
             log_error("health_db_error", error=str(e))
         # Check LLM live status on each call (short timeout), but log only on state change
-        s = get_settings()
-        base = s.llm_base_url.rstrip("/")
-        url = f"{base}/models"
+        base = llm_base
         prev = bool(app.state.llm_online)
         live = False
         try:
-            async with httpx.AsyncClient(timeout=1.5) as client:
-                r = await client.get(url)
-                r.raise_for_status()
-                _ = r.json()
+            await llm.list_models(timeout=1.5)
             live = True
         except Exception:
             live = False
@@ -178,29 +242,40 @@ def create_app() -> FastAPI:
         return {
             "db": ok_db,
             "llm_online": bool(live),
-            "model": s.llm_model,
+            "model": llm_model,
             "llm_base_url": base,
         }
 
+    # Only LLM_ONLINE flips at runtime, so both /config variants are pre-encoded
+    def _config_bytes(llm_online: bool) -> bytes:
+        s = settings
+        return orjson.dumps(
+            {
+                "LM_BASE_URL": s.llm_base_url,
+                "MODEL_CONTROLLER": s.llm_model,
+                "K": s.max_context_messages,
+                "SUMMARY_TRIGGER": s.summarize_after_messages,
+                "MAX_UPLOAD_MB": s.max_upload_mb,
+                "ALLOWED_EXTS": s.allowed_exts,
+                "LLM_ONLINE": llm_online,
+                "CONTEXT_WINDOW_TOKENS": s.context_window_tokens,
+                "CONTEXT_PROMPT_BUDGET_RATIO": s.context_prompt_budget_ratio,
+                "CONTEXT_HYSTERESIS_TOKENS": s.context_hysteresis_tokens,
+                "APP_BASE_URL": s.app_base_url,
+            }
+        )
+
+    config_bytes_online = _config_bytes(True)
+    config_bytes_offline = _config_bytes(False)
+
     @app.get("/config")
-    async def get_config() -> dict[str, Any]:
-        s = get_settings()
-        return {
-            "LM_BASE_URL": s.llm_base_url,
-            "MODEL_CONTROLLER": s.llm_model,
-            "K": s.max_context_messages,
-            "SUMMARY_TRIGGER": s.summarize_after_messages,
-            "MAX_UPLOAD_MB": s.max_upload_mb,
-            "ALLOWED_EXTS": s.allowed_exts,
-            "LLM_ONLINE": bool(app.state.llm_online),
-            "CONTEXT_WINDOW_TOKENS": s.context_window_tokens,
-            "CONTEXT_PROMPT_BUDGET_RATIO": s.context_prompt_budget_ratio,
-            "CONTEXT_HYSTERESIS_TOKENS": s.context_hysteresis_tokens,
-            "APP_BASE_URL": s.app_base_url,
-        }
+    async def get_config() -> Response:
+        body = config_bytes_online if app.state.llm_online else config_bytes_offline
+        return Response(content=body, media_type="application/json")
 
-    @app.post("/responses", response_model=ResponsePayload)
-    async def post_responses(req: ResponseRequest) -> ResponsePayload:
+    @app.post("/responses", response_model=ResponsePayload, openapi_extra=_RESPONSE_REQUEST_OPENAPI)
+    async def post_responses(request: Request) -> FastORJSONResponse:
+        req = _parse_response_request(await request.body())
         rid = str(_uuid.uuid4())
         resp_id: str | None = None
         try:
@@ -210,7 +285,16 @@ def create_app() -> FastAPI:
                 user_text=req.input_text,
                 store=req.store,
             )
-            return ResponsePayload(response_id=resp_id, thread_id=actual_thread_id, output_text=output_text, status="completed", usage=usage)
+            # Return the response directly: skips response_model re-validation and jsonable_encoder
+            return FastORJSONResponse(
+                {
+                    "response_id": resp_id,
+                    "thread_id": actual_thread_id,
+                    "output_text": output_text,
+                    "status": "completed",
+                    "usage": usage,
+                }
+            )
         except Exception as e:  # noqa: BLE001
             if resp_id:
                 log_error("post_responses_error", error=str(e), trace_id=rid, response_id=resp_id)
@@ -229,14 +313,14 @@ def create_app() -> FastAPI:
         return detail
 
     @app.get("/threads/{thread_id}/messages")
-    async def get_thread_messages(thread_id: str, limit: int = Query(50, ge=1, le=500)) -> Any:
+    async def get_thread_messages(thread_id: str, limit: int = Query(50, ge=1, le=500)) -> FastORJSONResponse:
         rows = await db.get_thread_messages(thread_id, limit)
-        return list(reversed(rows))
+        return FastORJSONResponse(rows)
 
     @app.get("/threads/{thread_id}/summary")
-    async def get_thread_summary(thread_id: str) -> Any:
+    async def get_thread_summary(thread_id: str) -> FastORJSONResponse:
         summary = await db.get_summary(thread_id)
-        return {"thread_id": thread_id, "summary": summary or ""}
+        return FastORJSONResponse({"thread_id": thread_id, "summary": summary or ""})
 
     @app.post("/threads/{thread_id}/summarize")
     async def post_thread_summarize(thread_id: str) -> Any:
@@ -248,13 +332,27 @@ def create_app() -> FastAPI:
             raise HTTPException(status_code=500, detail="internal error")
 
     @app.get("/file/{file_id}")
-    async def get_file(file_id: str) -> FileResponse:
-        # Use configured files_dir for consistency with uploader
-        base = Path(get_settings().files_dir).resolve()
-        path = (base / file_id).resolve()
-        if not path.is_file() or base not in path.parents:
+    async def get_file(file_id: str, request: Request) -> Response:
+        # Validate the name before touching the filesystem; no per-request resolve()
+        if not FILE_ID_RE.match(file_id):
             raise HTTPException(status_code=404, detail="not found")
-        return FileResponse(path)
+        path = files_base / file_id
+        try:
+            st = path.stat()
+        except OSError:
+            raise HTTPException(status_code=404, detail="not found")
+        if not stat.S_ISREG(st.st_mode):
+            raise HTTPException(status_code=404, detail="not found")
+        etag = '"%x-%x"' % (st.st_mtime_ns, st.st_size)
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "public, max-age=31536000, immutable" if CONTENT_ADDRESSED_RE.match(file_id) else "no-cache",
+        }
+        inm = request.headers.get("if-none-match")
+        if inm and _etag_matches(inm, etag):
+            return Response(status_code=304, headers=headers)
+        # Pass the stat result through so FileResponse doesn't stat() again
+        return FileResponse(path, headers=headers, stat_result=st)
 
     @app.get("/debug/context/{thread_id}")
     async def get_debug_context(thread_id: str) -> Any:
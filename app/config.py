@@ -5,7 +5,9 @@ for upload settings to match UI requirements.
 
 - LOCALAPI_API_HOST (default: 127.0.0.1)
 - LOCALAPI_API_PORT (default: 8080)
+- LOCALAPI_WORKERS (default: 1) -> uvicorn worker processes for `python Local_Ai.py`
 - LOCALAPI_DATABASE_PATH (default: data/local_api.db)
+- LOCALAPI_DB_READERS (default: 4) -> read-only SQLite connections next to the single writer
 - LOCALAPI_LLM_BASE_URL (default: http://192.168.0.111:1234/v1)
 - LOCALAPI_LLM_MODEL (default: qwen/qwen3-14b)
 - LOCALAPI_VISION_MODEL (default: qwen2.5-vl-7b-instruct@q8_0)
@@ -31,11 +33,10 @@ New context budget settings:
 """
 from __future__ import annotations
 
-import os
 from functools import lru_cache
-from typing import List
+from typing import List, Union
 
-from pydantic import Field, field_validator
+from pydantic import AliasChoices, Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -44,11 +45,15 @@ class Settings(BaseSettings):
 
     api_host: str = Field(default="127.0.0.1")
     api_port: int = Field(default=8080)
+    # Worker processes when started via `python Local_Ai.py` (each has its own DB/LLM handles)
+    workers: int = Field(default=1, ge=1)
 
     # Base public URL for generating absolute links (no trailing slash)
     app_base_url: str = Field(default="http://127.0.0.1:8080")
 
     database_path: str = Field(default="data/local_api.db")
+    # Read-only SQLite connections for SELECTs (one writer connection is always used)
+    db_readers: int = Field(default=4, ge=1, le=32)
 
     llm_base_url: str = Field(default="http://192.168.0.111:1234/v1")
     llm_model: str = Field(default="qwen/qwen3-14b")
@@ -68,17 +73,27 @@ class Settings(BaseSettings):
     # Tools handling mode: off | passthrough (forward OpenAI tools to backend)
     tools_mode: str = Field(default="off")
 
-    # Upload settings (can be overridden by LOCALAI_* env vars)
-    max_upload_mb: int = Field(default=25, ge=1)
-    allowed_exts: List[str] = Field(default_factory=lambda: [
-        ".png",
-        ".jpg",
-        ".jpeg",
-        ".webp",
-        ".gif",
-        ".pdf",
-        ".txt",
-    ])
+    # Upload settings: LOCALAI_* (legacy UI names) take precedence over LOCALAPI_*.
+    # An explicit validation_alias bypasses env_prefix, so both names are listed.
+    # allowed_exts accepts `str` so a CSV env value is not JSON-decoded by the env source;
+    # _parse_allowed_exts always turns it into a list.
+    max_upload_mb: int = Field(
+        default=25,
+        ge=1,
+        validation_alias=AliasChoices("LOCALAI_MAX_UPLOAD_MB", "LOCALAPI_MAX_UPLOAD_MB"),
+    )
+    allowed_exts: Union[List[str], str] = Field(
+        validation_alias=AliasChoices("LOCALAI_ALLOWED_EXTS", "LOCALAPI_ALLOWED_EXTS"),
+        default_factory=lambda: [
+            ".png",
+            ".jpg",
+            ".jpeg",
+            ".webp",
+            ".gif",
+            ".pdf",
+            ".txt",
+        ],
+    )
 
     # ---- Context window budgeting ----
     # Maximum model context window (tokens)
@@ -123,21 +138,8 @@ class Settings(BaseSettings):
 
 @lru_cache(maxsize=1)
 def get_settings() -> Settings:
-    """Return cached settings instance.
+    """Return cached settings instance (built lazily on first use).
 
-    Also honor LOCALAI_MAX_UPLOAD_MB and LOCALAI_ALLOWED_EXTS as overrides
-    for DX compatibility with UI prompts.
+    LOCALAI_MAX_UPLOAD_MB / LOCALAI_ALLOWED_EXTS overrides are field aliases on Settings.
     """
-    overrides = {}
-    if "LOCALAI_MAX_UPLOAD_MB" in os.environ:
-        try:
-            overrides["max_upload_mb"] = int(os.environ["LOCALAI_MAX_UPLOAD_MB"])
-        except Exception:
-            pass
-    if "LOCALAI_ALLOWED_EXTS" in os.environ:
-        overrides["allowed_exts"] = os.environ["LOCALAI_ALLOWED_EXTS"]
-    return Settings(**overrides)
-
-
-# Optional module-level singleton for direct import in UI code
-settings = get_settings()
+    return Settings()
@@ -1,41 +1,203 @@
-"""Async SQLite data access layer using aiosqlite.
+"""Async SQLite data access layer: aiosqlite writer, sqlite3 readers on the default thread pool.
 
 Schema:
-- threads(id TEXT PRIMARY KEY, created_at REAL)
-- messages(id TEXT PRIMARY KEY, thread_id TEXT, role TEXT, content TEXT, created_at REAL,
+- threads(id TEXT PRIMARY KEY, created_at INTEGER)
+- messages(id TEXT PRIMARY KEY, thread_id TEXT, role TEXT, content TEXT, created_at INTEGER,
            token_count INTEGER DEFAULT 0)
-- summaries(thread_id TEXT PRIMARY KEY, content TEXT, created_at REAL)
-- profiles(id TEXT PRIMARY KEY, name TEXT UNIQUE, settings_json TEXT, created_at REAL)
+- responses(id TEXT PRIMARY KEY, thread_id TEXT, request_message_id TEXT, response_message_id TEXT,
+            status TEXT, usage_json TEXT (legacy), error_text TEXT, created_at INTEGER,
+            prompt_tokens INTEGER, completion_tokens INTEGER, total_tokens INTEGER)
+- summaries(thread_id TEXT PRIMARY KEY, content TEXT (legacy), created_at INTEGER, content_zstd BLOB)
+- profiles(id TEXT PRIMARY KEY, name TEXT UNIQUE, settings_json TEXT, created_at INTEGER)
 """
 from __future__ import annotations
 
 import asyncio
-import json
+import hashlib
 import os
+import sqlite3
+import threading
 import time
 import uuid
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Sequence
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
 
 import aiosqlite
+import orjson
 
 from .logging_utils import log_error, log_info
 
+try:  # optional: without it summaries are stored uncompressed
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None  # type: ignore[assignment]
 
+
+# Per-connection tuning, applied to the writer and to every read-only connection
+CONN_PRAGMAS = [
+    "PRAGMA busy_timeout=5000;",
+    "PRAGMA temp_store=MEMORY;",
+    # Hot reads (thread messages, summaries, responses): 64 MiB page cache, 256 MiB mmap window
+    "PRAGMA cache_size=-65536;",
+    "PRAGMA mmap_size=268435456;",
+]
+
+# Read-only pool connections: refuse writes even for statements mode=ro would let through (e.g. PRAGMA setters)
+READER_PRAGMAS = [
+    "PRAGMA query_only=ON;",
+    *CONN_PRAGMAS,
+]
+
+# ---- hot SQL, kept as constants so every call binds the same text (sqlite3 statement cache) ----
+SQL_INSERT_THREAD = "INSERT INTO threads(id, created_at) VALUES (?, ?)"
+SQL_INSERT_MESSAGE = "INSERT INTO messages(id, thread_id, role, content, created_at) VALUES (?,?,?,?,?)"
+SQL_INSERT_RESPONSE = (
+    "INSERT INTO responses(id, thread_id, request_message_id, response_message_id, status, error_text, created_at,"
+    " prompt_tokens, completion_tokens, total_tokens)"
+    " VALUES (?,?,?,?,?,?,?,?,?,?)"
+)
+# Stored created_at is integer ns, but the API has always returned float Unix seconds: convert on the
+# way out. CAST first: migrated legacy DBs keep a REAL-affinity column, so their values read back as floats.
+SQL_THREAD_MESSAGES = (
+    "SELECT id, role, content, CAST(ts AS INTEGER) / 1e9 AS created_at FROM ("
+    "SELECT id, role, content, created_at AS ts FROM messages WHERE thread_id = ? ORDER BY created_at DESC LIMIT ?"
+    ") ORDER BY ts ASC"
+)
+SQL_THREAD_MESSAGES_EXCLUDING = (
+    "SELECT id, role, content, CAST(ts AS INTEGER) / 1e9 AS created_at FROM ("
+    "SELECT id, role, content, created_at AS ts FROM messages WHERE thread_id = ? AND role NOT IN ({roles})"
+    " ORDER BY created_at DESC LIMIT ?"
+    ") ORDER BY ts ASC"
+)
+SQL_GET_SUMMARY = "SELECT content, content_zstd FROM summaries WHERE thread_id = ?"
+SQL_UPSERT_SUMMARY = (
+    "INSERT INTO summaries(thread_id, content, content_zstd, created_at) VALUES (?,'',?,?) "
+    "ON CONFLICT(thread_id) DO UPDATE SET content = '', content_zstd = excluded.content_zstd, "
+    "created_at = excluded.created_at"
+)
+SQL_RESPONSE_THREAD = "SELECT thread_id FROM responses WHERE id = ?"
+SQL_RESPONSE_DETAIL = (
+    "SELECT r.id as response_id, r.thread_id as thread_id, "
+    "r.prompt_tokens as prompt_tokens, r.completion_tokens as completion_tokens, r.total_tokens as total_tokens, "
+    "m.content as output_text "
+    "FROM responses r LEFT JOIN messages m ON m.id = r.response_message_id "
+    "WHERE r.id = ?"
+)
+SQL_UPSERT_PROFILE = (
+    "INSERT INTO profiles(id, name, settings_json, created_at) VALUES (?,?,?,?) "
+    "ON CONFLICT(name) DO UPDATE SET settings_json=excluded.settings_json, created_at=excluded.created_at "
+    # Re-storing the same value leaves the row (and its page) untouched
+    "WHERE profiles.settings_json IS NOT excluded.settings_json"
+)
+SQL_GET_PROFILE = "SELECT settings_json FROM profiles WHERE name=?"
+
+# Columns added after the first release: CREATE TABLE IF NOT EXISTS does not touch existing tables,
+# so apply_schema adds them and backfills from the legacy usage_json blob
+USAGE_COLUMNS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+# created_at moved from float seconds to integer nanoseconds; older rows are rescaled once
+TIMESTAMPED_TABLES = ("threads", "messages", "responses", "summaries", "profiles")
+
+# summaries.content_zstd: first byte tells how the rest is stored
+SUMMARY_RAW = 0
+SUMMARY_ZSTD = 1
+SUMMARY_COMPRESS_MIN = 512  # bytes; below this zstd framing outweighs the savings
+_ZSTD_C = zstandard.ZstdCompressor(level=3) if zstandard else None
+_ZSTD_D = zstandard.ZstdDecompressor() if zstandard else None
+
+# Prepared statements kept per connection (sqlite3 default: 128)
+CACHED_STATEMENTS = 256
+
+# Set while the current task is inside Database.transaction(); its writes join that transaction
+_IN_TXN: ContextVar[bool] = ContextVar("db_in_txn", default=False)
+
+# Writer only: journal_mode is persisted in the file, FK enforcement matters for writes
 PRAGMAS = [
     "PRAGMA journal_mode=WAL;",
     "PRAGMA synchronous=NORMAL;",
     "PRAGMA foreign_keys=ON;",
-    "PRAGMA busy_timeout=5000;",
-    "PRAGMA temp_store=MEMORY;",
+    # Keep the WAL file bounded: checkpoint every ~1000 pages, truncate leftovers to 64 MiB
+    "PRAGMA wal_autocheckpoint=1000;",
+    "PRAGMA journal_size_limit=67108864;",
+    *CONN_PRAGMAS,
 ]
 
 
+def _usage_params(usage: Dict[str, Any]) -> Tuple[int, int, int]:
+    """prompt/completion/total token counts as bind parameters (total derived when absent)."""
+    prompt = int(usage.get("prompt_tokens") or 0)
+    completion = int(usage.get("completion_tokens") or 0)
+    return prompt, completion, int(usage.get("total_tokens") or prompt + completion)
+
+
+def _pack_summary(text: str) -> bytes:
+    data = text.encode("utf-8")
+    if _ZSTD_C is not None and len(data) >= SUMMARY_COMPRESS_MIN:
+        return bytes([SUMMARY_ZSTD]) + _ZSTD_C.compress(data)
+    return bytes([SUMMARY_RAW]) + data
+
+
+def _unpack_summary(blob: bytes) -> str:
+    kind, payload = blob[0], blob[1:]
+    if kind == SUMMARY_ZSTD:
+        if _ZSTD_D is None:
+            raise RuntimeError("summary is zstd-compressed but 'zstandard' is not installed")
+        payload = _ZSTD_D.decompress(payload)
+    return payload.decode("utf-8")
+
+
+class _SyncReader:
+    """Plain sqlite3 read-only connection whose queries run via asyncio.to_thread.
+
+    Unlike aiosqlite (one dedicated thread per connection) reads are spread over the
+    default executor. The pool leases a reader to one task at a time; the lock also
+    covers a query still running in its thread after the awaiting task was cancelled.
+    """
+
+    def __init__(self, uri: str) -> None:
+        self._conn = sqlite3.connect(
+            uri,
+            uri=True,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=CACHED_STATEMENTS,
+        )
+        # All SELECTs go through readers: set the row factory once, not per fetch
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        for pragma in READER_PRAGMAS:
+            self._conn.execute(pragma)
+
+    def fetch_one(self, sql: str, params: Sequence[Any]) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def fetch_all(self, sql: str, params: Sequence[Any]) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
 class Database:
-    def __init__(self, path: str) -> None:
+    """One aiosqlite writer connection plus a small pool of sqlite3 read-only connections.
+
+    With WAL the SELECTs (fetch_one/fetch_all) do not queue behind INSERT/UPDATE
+    commits, and concurrent reads run on several executor threads at once.
+    """
+
+    def __init__(self, path: str, readers: Optional[int] = None) -> None:
         self._path = path
+        # Serializes use of the single writer connection (plain writes vs. open transactions)
         self._pool_lock = asyncio.Lock()
         self._db: Optional[aiosqlite.Connection] = None
+        self._n_readers = readers or min(4, os.cpu_count() or 1)
+        self._reader_conns: List[_SyncReader] = []
+        self._readers: Optional[asyncio.Queue[_SyncReader]] = None
 
     @property
     def path(self) -> str:
@@ -44,74 +206,168 @@ class Database:
     async def connect(self) -> None:
         db_dir = Path(self._path).parent
         db_dir.mkdir(parents=True, exist_ok=True)
-        self._db = await aiosqlite.connect(self._path)
+        self._db = await aiosqlite.connect(self._path, cached_statements=CACHED_STATEMENTS)
         for pragma in PRAGMAS:
             await self._db.execute(pragma)
         await self._db.commit()
+        # Readers open after the writer so the file exists and is already in WAL mode
+        ro_uri = f"{Path(self._path).resolve().as_uri()}?mode=ro"
+        self._readers = asyncio.Queue()
+        for _ in range(self._n_readers):
+            conn = await asyncio.to_thread(_SyncReader, ro_uri)
+            self._reader_conns.append(conn)
+            self._readers.put_nowait(conn)
 
     async def close(self) -> None:
+        for conn in self._reader_conns:
+            await asyncio.to_thread(conn.close)
+        self._reader_conns = []
+        self._readers = None
         if self._db is not None:
+            # Refresh query planner statistics for tables whose shape changed this run (cheap)
+            try:
+                await self._db.execute("PRAGMA optimize;")
+            except Exception as e:  # noqa: BLE001
+                log_error("sqlite_optimize_error", error=str(e))
             await self._db.close()
             self._db = None
 
-    # ---- low-level helpers with locked-retry on 'database is locked' ----
-
-    async def _execute_with_retry(self, func, *args) -> Any:
-        assert self._db is not None
-        delays = [0.01, 0.02, 0.04, 0.08]
-        last_err: Optional[Exception] = None
-        for i, d in enumerate(delays, start=1):
+    @asynccontextmanager
+    async def _reader(self) -> AsyncIterator[_SyncReader]:
+        """Lease a read-only connection for the duration of one query."""
+        assert self._readers is not None, "Database not connected"
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    # ---- low-level helpers ----
+    # Writes are serialized on the single writer by _pool_lock and transactions start with
+    # BEGIN IMMEDIATE, so in-process contention never reaches SQLite. Cross-process waits
+    # (other workers) are handled inside SQLite by busy_timeout; a 'database is locked'
+    # after that surfaces to the caller instead of being masked by sleep-retries.
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        """Group writes into one BEGIN IMMEDIATE ... COMMIT (a single WAL fsync).
+
+        execute()/execute_many() awaited by this task inside the block join the
+        transaction instead of committing each statement; writes from other tasks
+        wait for the block to finish. Nested use joins the outer transaction.
+        """
+        assert self._db is not None, "Database not connected"
+        if _IN_TXN.get():
+            yield
+            return
+        async with self._pool_lock:
+            token = _IN_TXN.set(True)
             try:
-                return await func(*args)
-            except aiosqlite.OperationalError as e:  # type: ignore[attr-defined]
-                msg = str(e)
-                if "database is locked" in msg:
-                    log_error("sqlite_locked", attempt=i, delay_s=d)
-                    await asyncio.sleep(d)
-                    continue
-                raise
-            except Exception as e:  # noqa: BLE001
-                last_err = e
-                break
-        if last_err:
-            raise last_err
+                await self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    yield
+                except BaseException:
+                    await self._db.rollback()
+                    raise
+                await self._db.commit()
+            finally:
+                _IN_TXN.reset(token)
 
     async def executescript(self, script: str) -> None:
         assert self._db is not None, "Database not connected"
-        await self._execute_with_retry(self._db.executescript, script)
-        await self._db.commit()
+        async with self._pool_lock:
+            await self._db.executescript(script)
+            await self._db.commit()
+
+    async def apply_schema(self, script: str) -> bool:
+        """Apply DDL script unless the database already carries its fingerprint.
+
+        The fingerprint (28 bits of sha256 of the script) is kept in PRAGMA user_version,
+        so restarts/reloads with an unchanged schema.sql skip the DDL entirely.
+        Returns True when the script was executed.
+        """
+        version = int(hashlib.sha256(script.encode("utf-8")).hexdigest()[:7], 16) or 1
+        row = await self.fetch_one("PRAGMA user_version", [])
+        if row and int(row["user_version"]) == version:
+            return False
+        await self.executescript(script)
+        await self._migrate_usage_columns()
+        await self._migrate_summary_blob()
+        await self._migrate_timestamps()
+        await self.execute(f"PRAGMA user_version = {version}")
+        return True
+
+    async def _migrate_usage_columns(self) -> None:
+        rows = await self.fetch_all("PRAGMA table_info(responses)", [])
+        existing = {r["name"] for r in rows}
+        missing = [c for c in USAGE_COLUMNS if c not in existing]
+        if not missing:
+            return
+        async with self.transaction():
+            for col in missing:
+                await self.execute(f"ALTER TABLE responses ADD COLUMN {col} INTEGER NOT NULL DEFAULT 0")
+                await self.execute(
+                    f"UPDATE responses SET {col} = COALESCE(json_extract(usage_json, '$.{col}'), 0) "
+                    "WHERE usage_json IS NOT NULL AND json_valid(usage_json)"
+                )
+        log_info("schema_migrated", added_columns=missing)
+
+    async def _migrate_summary_blob(self) -> None:
+        rows = await self.fetch_all("PRAGMA table_info(summaries)", [])
+        if any(r["name"] == "content_zstd" for r in rows):
+            return
+        # Existing rows keep their text in content; get_summary falls back to it
+        await self.execute("ALTER TABLE summaries ADD COLUMN content_zstd BLOB")
+        log_info("schema_migrated", added_columns=["content_zstd"])
+
+    async def _migrate_timestamps(self) -> None:
+        # Seconds-based values are < 1e12; nanosecond ones are ~1e18, so this is idempotent
+        async with self.transaction():
+            for table in TIMESTAMPED_TABLES:
+                await self.execute(
+                    f"UPDATE {table} SET created_at = CAST(created_at * 1000000000 AS INTEGER) WHERE created_at < 1e12"
+                )
 
     async def execute(self, sql: str, params: Sequence[Any] | None = None) -> None:
         assert self._db is not None, "Database not connected"
-        await self._execute_with_retry(self._db.execute, sql, params or [])
-        await self._db.commit()
+        if _IN_TXN.get():
+            await self._db.execute(sql, params or [])
+            return
+        async with self._pool_lock:
+            await self._db.execute(sql, params or [])
+            await self._db.commit()
+
+    async def execute_many(self, sql: str, seq_of_params: Iterable[Sequence[Any]]) -> None:
+        """Run one statement for many parameter rows (committed together)."""
+        assert self._db is not None, "Database not connected"
+        if _IN_TXN.get():
+            await self._db.executemany(sql, seq_of_params)
+            return
+        async with self._pool_lock:
+            await self._db.executemany(sql, seq_of_params)
+            await self._db.commit()
 
-    async def fetch_one(self, sql: str, params: Sequence[Any] | None = None) -> Optional[Dict[str, Any]]:
+    # fetch_* return sqlite3.Row (tuple-backed, indexable by column name) without a dict copy;
+    # materialize with dict(row) only where a JSON payload needs it.
+
+    async def fetch_one(self, sql: str, params: Sequence[Any] | None = None) -> Optional[sqlite3.Row]:
         assert self._db is not None, "Database not connected"
-        self._db.row_factory = aiosqlite.Row
-        async def _inner() -> Any:
-            async with self._db.execute(sql, params or []) as cursor:
-                return await cursor.fetchone()
-        row = await self._execute_with_retry(_inner)
-        return dict(row) if row else None
-
-    async def fetch_all(self, sql: str, params: Sequence[Any] | None = None) -> List[Dict[str, Any]]:
+        async with self._reader() as conn:
+            return await asyncio.to_thread(conn.fetch_one, sql, params or [])
+
+    async def fetch_all(self, sql: str, params: Sequence[Any] | None = None) -> List[sqlite3.Row]:
         assert self._db is not None, "Database not connected"
-        self._db.row_factory = aiosqlite.Row
-        async def _inner() -> Any:
-            async with self._db.execute(sql, params or []) as cursor:
-                return await cursor.fetchall()
-        rows = await self._execute_with_retry(_inner)
-        return [dict(r) for r in rows]
+        async with self._reader() as conn:
+            return await asyncio.to_thread(conn.fetch_all, sql, params or [])
 
     # ----------------- CRUD helpers -----------------
 
     async def create_thread(self) -> str:
         """Create a new thread and return its id."""
-        thread_id = str(uuid.uuid4())
+        thread_id = uuid.uuid4().hex
         await self.execute(
-            "INSERT INTO threads(id, created_at) VALUES (?, ?)",
-            [thread_id, time.time()],
+            SQL_INSERT_THREAD,
+            [thread_id, time.time_ns()],
         )
         return thread_id
 
@@ -120,10 +376,10 @@ class Database:
 
         Note: schema expects role in ('user','assistant','system','tool').
         """
-        message_id = str(uuid.uuid4())
+        message_id = uuid.uuid4().hex
         await self.execute(
-            "INSERT INTO messages(id, thread_id, role, content, created_at) VALUES (?,?,?,?,?)",
-            [message_id, thread_id, role, content_json, time.time()],
+            SQL_INSERT_MESSAGE,
+            [message_id, thread_id, role, content_json, time.time_ns()],
         )
         return message_id
 
@@ -137,54 +393,91 @@ class Database:
     ) -> str:
         """Insert a response record with status/usage/error and return response_id.
 
-        Requires columns: status TEXT, usage_json TEXT, error_text TEXT in responses table.
+        The row is written in its final state; turns with an assistant message go through record_reply.
         """
-        response_id = str(uuid.uuid4())
-        usage_json = json.dumps(usage, ensure_ascii=False)
+        response_id = uuid.uuid4().hex
         await self.execute(
-            (
-                "INSERT INTO responses(id, thread_id, request_message_id, response_message_id, status, usage_json, error_text, created_at)"
-                " VALUES (?,?,?,?,?,?,?,?)"
-            ),
+            SQL_INSERT_RESPONSE,
             [
                 response_id,
                 thread_id,
                 input_message_id,
                 None,
                 status,
-                usage_json,
                 error,
-                time.time(),
+                time.time_ns(),
+                *_usage_params(usage),
             ],
         )
         return response_id
 
-    async def update_response_output(self, response_id: str, output_message_id: str, status: str) -> None:
-        """Update response with generated assistant message id and final status."""
-        await self.execute(
-            "UPDATE responses SET response_message_id = ?, status = ? WHERE id = ?",
-            [output_message_id, status, response_id],
-        )
+    async def record_reply(
+        self,
+        thread_id: str,
+        user_msg_id: str,
+        assistant_json: str,
+        usage: Dict[str, Any],
+        *,
+        request_response_id: Optional[str] = None,
+    ) -> Tuple[str, str]:
+        """Persist the assistant message and its completed response row in one transaction.
 
-    async def get_thread_messages(self, thread_id: str, limit: int) -> List[Dict[str, Any]]:
-        """Return latest messages by created_at (descending), limited."""
-        rows = await self.fetch_all(
-            "SELECT id, role, content, created_at FROM messages WHERE thread_id = ? ORDER BY created_at DESC LIMIT ?",
-            [thread_id, limit],
-        )
-        return rows
+        The user message is stored up front (insert_message), so a failed LLM call still keeps it.
+        Returns (assistant_msg_id, response_id).
+        """
+        assistant_msg_id = uuid.uuid4().hex
+        response_id = request_response_id or uuid.uuid4().hex
+        now = time.time_ns()
+        async with self.transaction():
+            await self.execute(SQL_INSERT_MESSAGE, [assistant_msg_id, thread_id, "assistant", assistant_json, now])
+            await self.execute(
+                SQL_INSERT_RESPONSE,
+                [
+                    response_id,
+                    thread_id,
+                    user_msg_id,
+                    assistant_msg_id,
+                    "completed",
+                    None,
+                    now,
+                    *_usage_params(usage),
+                ],
+            )
+        return assistant_msg_id, response_id
+
+    async def get_thread_messages(
+        self, thread_id: str, limit: int, *, exclude_roles: Sequence[str] = ()
+    ) -> List[Dict[str, Any]]:
+        """Return the latest `limit` messages in chronological (ascending) order.
+
+        created_at is Unix seconds (float), whatever the storage precision.
+        Rows whose role is in `exclude_roles` are filtered in SQL and do not count towards `limit`.
+        """
+        if exclude_roles:
+            sql = SQL_THREAD_MESSAGES_EXCLUDING.format(roles=",".join("?" * len(exclude_roles)))
+            rows = await self.fetch_all(sql, [thread_id, *exclude_roles, limit])
+        else:
+            rows = await self.fetch_all(SQL_THREAD_MESSAGES, [thread_id, limit])
+        # Rows feed JSON responses and .get()-style consumers: materialize here only
+        return [dict(r) for r in rows]
 
     async def get_summary(self, thread_id: str) -> Optional[str]:
-        row = await self.fetch_one("SELECT content FROM summaries WHERE thread_id = ?", [thread_id])
-        return str(row["content"]) if row else None
+        row = await self.fetch_one(SQL_GET_SUMMARY, [thread_id])
+        if not row:
+            return None
+        blob = row["content_zstd"]
+        if blob:
+            try:
+                return _unpack_summary(blob)
+            except Exception as e:  # noqa: BLE001
+                log_error("summary_decode_error", thread_id=thread_id, error=str(e))
+                return None
+        return str(row["content"])
 
     async def upsert_summary(self, thread_id: str, summary: str) -> None:
         await self.execute(
-            (
-                "INSERT INTO summaries(thread_id, content, created_at) VALUES (?,?,?) "
-                "ON CONFLICT(thread_id) DO UPDATE SET content = excluded.content, created_at = excluded.created_at"
-            ),
-            [thread_id, summary, time.time()],
+            SQL_UPSERT_SUMMARY,
+            [thread_id, _pack_summary(summary), time.time_ns()],
         )
 
     async def resolve_thread(self, previous_response_id: Optional[str], explicit_thread_id: Optional[str]) -> str:
@@ -197,8 +490,8 @@ class Database:
         if explicit_thread_id:
             return explicit_thread_id
         if previous_response_id:
-            row = await self.fetch_one("SELECT thread_id FROM responses WHERE id = ?", [previous_response_id])
-            if row and row.get("thread_id"):
+            row = await self.fetch_one(SQL_RESPONSE_THREAD, [previous_response_id])
+            if row and row["thread_id"]:
                 return str(row["thread_id"])
         return await self.create_thread()
 
@@ -207,51 +500,36 @@ class Database:
 
         Joins responses with messages on response_message_id to fetch output_text.
         """
-        sql = (
-            "SELECT r.id as response_id, r.thread_id as thread_id, r.usage_json as usage_json, "
-            "m.content as output_text "
-            "FROM responses r LEFT JOIN messages m ON m.id = r.response_message_id "
-            "WHERE r.id = ?"
-        )
-        row = await self.fetch_one(sql, [response_id])
+        row = await self.fetch_one(SQL_RESPONSE_DETAIL, [response_id])
         if not row:
             return None
-        usage: Dict[str, Any] = {}
-        if row.get("usage_json"):
-            try:
-                usage = json.loads(row["usage_json"]) if isinstance(row["usage_json"], str) else {}
-            except Exception:
-                usage = {}
+        usage = {c: int(row[c] or 0) for c in USAGE_COLUMNS}
         return {
-            "response_id": str(row.get("response_id", response_id)),
-            "thread_id": str(row.get("thread_id", "")),
-            "output_text": str(row.get("output_text", "")),
+            "response_id": str(row["response_id"] or response_id),
+            "thread_id": str(row["thread_id"] or ""),
+            # LEFT JOIN: no assistant message yet -> NULL
+            "output_text": str(row["output_text"] or ""),
             "usage": usage,
         }
 
     # --------------- profiles (memory) ---------------
 
     async def upsert_profile_kv(self, key: str, value: str) -> None:
-        """Store single key/value in profiles (name unique)."""
-        assert self._db is not None
-        now = time.time()
-        payload = json.dumps({"value": value}, ensure_ascii=False)
-        # Use UPSERT on name unique constraint
+        """Store single key/value in profiles (name unique) with one atomic UPSERT."""
+        now = time.time_ns()
+        payload = orjson.dumps({"value": value}).decode()
         await self.execute(
-            (
-                "INSERT INTO profiles(id, name, settings_json, created_at) VALUES (?,?,?,?) "
-                "ON CONFLICT(name) DO UPDATE SET settings_json=excluded.settings_json, created_at=excluded.created_at"
-            ),
-            [str(uuid.uuid4()), key, payload, now],
+            SQL_UPSERT_PROFILE,
+            [uuid.uuid4().hex, key, payload, now],
         )
         log_info("profile_upsert", key=key, value=value)
 
     async def get_profile_value(self, key: str) -> Optional[str]:
-        row = await self.fetch_one("SELECT settings_json FROM profiles WHERE name=?", [key])
+        row = await self.fetch_one(SQL_GET_PROFILE, [key])
         if not row:
             return None
         try:
-            data = json.loads(row["settings_json"]) if row["settings_json"] else {}
+            data = orjson.loads(row["settings_json"]) if row["settings_json"] else {}
             v = data.get("value")
             if v is None:
                 return None
@@ -5,15 +5,115 @@ Network retries were removed to let caller decide logging and timing.
 """
 from __future__ import annotations
 
-import json
+import importlib.util
+import random
+import re
 import time
-from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
 
 import httpx
+import orjson
 
 from .config import get_settings
 
-SSE_PREFIX = b"data: "
+# SSE field name; the single space after the colon is optional per the spec
+SSE_PREFIX = b"data:"
+
+# HTTP/2 needs the optional 'h2' package (httpx[http2]); negotiated via ALPN on https, plain http stays on 1.1
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+# Keep idle connections to the LLM server warm between chats (no reconnect per request)
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=60.0)
+CONNECT_TIMEOUT = 5.0
+# Connection-level retries (connect errors, e.g. a dropped idle keep-alive) handled inside the transport
+CONNECT_RETRIES = 2
+
+# Token frames are {"choices":[{"delta":{"content":"..."}}]}: pull the string without building dicts.
+# Anything else (content null, role-only, usage frames) falls through to orjson.loads.
+_FAST_CONTENT = re.compile(rb'"content"\s*:\s*"((?:[^"\\]|\\.)*)"').search
+
+# Sleep before retry N (1-based) is RETRY_BACKOFF[N-1] scaled by a ±15% jitter
+RETRY_BACKOFF = (0.25, 0.5, 1.0)
+
+
+def backoff_delay(attempt: int) -> float:
+    return RETRY_BACKOFF[min(attempt, len(RETRY_BACKOFF)) - 1] * (0.85 + 0.3 * random.random())
+
+
+# Request bodies are encoded once with orjson and sent as content= (httpx json= re-encodes with stdlib json)
+JSON_HEADERS = {"content-type": "application/json"}
+
+
+def build_http_client(timeout: float, *, retries: int = CONNECT_RETRIES) -> httpx.AsyncClient:
+    """AsyncClient tuned for the LLM server: HTTP/2 when available, warm keep-alive pool.
+
+    `timeout` bounds reads (long generations); connecting to a local server should fail fast.
+    `retries` are transport-level connect retries; probes pass 0 so they fail within their own timeout.
+    """
+    # Pool/HTTP2 settings live on the transport: AsyncClient ignores its own when one is passed
+    transport = httpx.AsyncHTTPTransport(http2=_HTTP2, limits=HTTP_LIMITS, retries=retries)
+    return httpx.AsyncClient(timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT), transport=transport)
+
+
+async def _iter_sse_data(r: httpx.Response) -> AsyncIterator[bytes]:
+    """Yield the payload of each `data:` line as bytes, reassembling lines split across chunks.
+
+    Stays on bytes end to end: orjson parses them directly, no per-frame UTF-8 decode.
+    """
+    buf = b""
+    async for chunk in r.aiter_bytes():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            line = line.strip()
+            if line.startswith(SSE_PREFIX):
+                yield line[len(SSE_PREFIX):].lstrip()
+    line = buf.strip()
+    if line.startswith(SSE_PREFIX):
+        yield line[len(SSE_PREFIX):].lstrip()
+
+
+def _usage_counts(usage: Dict[str, Any]) -> Dict[str, int]:
+    prompt_tokens = int(usage.get("prompt_tokens", 0))
+    completion_tokens = int(usage.get("completion_tokens", 0))
+    total_tokens = int(usage.get("total_tokens", prompt_tokens + completion_tokens))
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": total_tokens,
+    }
+
+
+async def iter_content_deltas(r: httpx.Response, usage: Optional[Dict[str, int]] = None) -> AsyncIterator[str]:
+    """Content deltas of an OpenAI-style SSE chat response; fills `usage` if given and the server reports it."""
+    async for data in _iter_sse_data(r):
+        if data == b"[DONE]":
+            return
+        m = _FAST_CONTENT(data)
+        if m:
+            raw = m.group(1)
+            # Escaped strings (\n, \", \uXXXX) are rare per token: let orjson unescape those
+            delta = orjson.loads(b'"' + raw + b'"') if b"\\" in raw else raw.decode("utf-8")
+            if delta:
+                yield delta
+            if usage is None or b'"usage"' not in data:
+                continue
+        try:
+            obj = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            continue
+        if usage is not None and (reported := obj.get("usage")):
+            usage.update(_usage_counts(reported))
+        if m:
+            continue  # content already yielded by the fast path
+        # Plain lookups, no exceptions per token; "message" covers proxies that send full messages
+        choices = obj.get("choices")
+        if not choices:
+            continue  # e.g. the trailing usage-only frame
+        ch0 = choices[0]
+        delta = (ch0.get("delta") or ch0.get("message") or {}).get("content")
+        if delta:
+            yield delta
 
 
 class LLMClient:
@@ -24,68 +124,57 @@ class LLMClient:
         self._timeout = s.request_timeout
         self._temperature = s.temperature
         self._max_tokens = s.max_tokens
-        self._client = httpx.AsyncClient(timeout=self._timeout)
-
-    async def aclose(self) -> None:
-        await self._client.aclose()
-
-    async def chat_raw(self, messages: List[Dict[str, Any]], *, tools: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
-        url = f"{self._base}/chat/completions"
-        payload: Dict[str, Any] = {
+        # Built once: every chat call only adds messages (and tools) to a copy of one of these
+        self._chat_url = f"{self._base}/chat/completions"
+        base_payload: Dict[str, Any] = {
             "model": self._model,
-            "messages": messages,
             "temperature": self._temperature,
             "max_tokens": self._max_tokens,
-            "stream": False,
         }
-        resp = await self._client.post(url, json=payload)
+        self._payload_once = {**base_payload, "stream": False}
+        # include_usage: the server sends exact token counts in a final frame (no local estimate needed)
+        self._payload_stream = {**base_payload, "stream": True, "stream_options": {"include_usage": True}}
+        self._client = build_http_client(self._timeout)
+        # Connectivity probes (startup, /health) get their own client without connect retries:
+        # a probe must fail within the timeout it asks for, not after 3 attempts plus backoff
+        self._probe_client = build_http_client(self._timeout, retries=0)
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+        await self._probe_client.aclose()
+
+    async def list_models(self, *, timeout: float | None = None) -> Dict[str, Any]:
+        """GET /models on the probe client (no connect retries; used for connectivity checks)."""
+        resp = await self._probe_client.get(f"{self._base}/models", timeout=timeout if timeout is not None else self._timeout)
+        resp.raise_for_status()
+        return orjson.loads(resp.content)
+
+    async def chat_raw(self, messages: List[Dict[str, Any]], *, tools: Optional[Sequence[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        payload = self._payload_once | {"messages": messages}
+        if tools:
+            payload["tools"] = tools
+        resp = await self._client.post(self._chat_url, content=orjson.dumps(payload), headers=JSON_HEADERS)
         resp.raise_for_status()
-        return resp.json()
+        return orjson.loads(resp.content)
 
-    async def chat(self, messages: List[Dict[str, Any]], *, tools: Optional[List[Dict[str, Any]]] = None) -> Tuple[str, Dict[str, int]]:
+    async def chat(self, messages: List[Dict[str, Any]], *, tools: Optional[Sequence[Dict[str, Any]]] = None) -> Tuple[str, Dict[str, int]]:
         data = await self.chat_raw(messages, tools=tools)
         message = data.get("choices", [{}])[0].get("message", {})
         text = message.get("content") or ""
-        usage = data.get("usage", {}) or {}
-        prompt_tokens = int(usage.get("prompt_tokens", 0))
-        completion_tokens = int(usage.get("completion_tokens", 0))
-        total_tokens = int(usage.get("total_tokens", prompt_tokens + completion_tokens))
-        return text, {
-            "prompt_tokens": prompt_tokens,
-            "completion_tokens": completion_tokens,
-            "total_tokens": total_tokens,
-        }
+        return text, _usage_counts(data.get("usage", {}) or {})
 
-    async def chat_stream(self, messages: List[Dict[str, Any]], *, tools: Optional[List[Dict[str, Any]]] = None) -> AsyncIterator[str]:
-        url = f"{self._base}/chat/completions"
-        payload: Dict[str, Any] = {
-            "model": self._model,
-            "messages": messages,
-            "temperature": self._temperature,
-            "max_tokens": self._max_tokens,
-            "stream": True,
-        }
-        async with self._client.stream("POST", url, json=payload) as r:
+    async def chat_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        *,
+        tools: Optional[Sequence[Dict[str, Any]]] = None,
+        usage: Optional[Dict[str, int]] = None,
+    ) -> AsyncIterator[str]:
+        """Yield content deltas. If `usage` is given it is filled with the server-reported counts, when sent."""
+        payload = self._payload_stream | {"messages": messages}
+        if tools:
+            payload["tools"] = tools
+        async with self._client.stream("POST", self._chat_url, content=orjson.dumps(payload), headers=JSON_HEADERS) as r:
             r.raise_for_status()
-            async for chunk in r.aiter_raw():
-                for line in chunk.splitlines():
-                    line = line.strip()
-                    if not line or not line.startswith(SSE_PREFIX):
-                        continue
-                    data = line[len(SSE_PREFIX):].decode("utf-8", errors="ignore")
-                    if data == "[DONE]":
-                        return
-                    try:
-                        obj = json.loads(data)
-                    except Exception:
-                        continue
-                    delta = ""
-                    try:
-                        delta = obj["choices"][0]["delta"].get("content") or ""
-                    except Exception:
-                        try:
-                            delta = obj["choices"][0]["message"].get("content") or ""
-                        except Exception:
-                            delta = ""
-                    if delta:
-                        yield delta
+            async for delta in iter_content_deltas(r, usage):
+                yield delta
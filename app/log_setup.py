@@ -1,6 +1,6 @@
 """Uvicorn logging configuration helpers.
 
-- Hides noisy /health access logs
+- Hides noisy /health access logs (logger-level filter, installed for both entrypoints)
 - Suppresses websocket connect/disconnect chatter
 - Formats our JSON logs (already structured) and uvicorn logs nicely
 """
@@ -15,6 +15,13 @@ from typing import Any, Dict
 
 class HealthAccessFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:  # noqa: D401
+        # uvicorn access records carry (client_addr, method, path, http_version, status_code)
+        # in record.args; checking the path avoids %-formatting every record
+        args = record.args
+        if isinstance(args, tuple) and len(args) >= 3 and isinstance(args[2], str):
+            return "/health" not in args[2]
+        if not args and isinstance(record.msg, str):
+            return "/health" not in record.msg
         try:
             msg = record.getMessage()
         except Exception:  # noqa: BLE001
@@ -22,20 +29,62 @@ class HealthAccessFilter(logging.Filter):
         return "/health" not in msg
 
 
+# Single instance so repeated apply_default_uvicorn_logging() calls don't stack filters
+_HEALTH_FILTER = HealthAccessFilter()
+
+
+# Leading run of literal characters of a regex (up to the first metacharacter)
+_LITERAL_PREFIX = re.compile(r"[^\\.^$*+?{}\[\]|()]*")
+
+
+def _has_top_level_alternation(pattern: str) -> bool:
+    depth, in_class, escaped = 0, False, False
+    for ch in pattern:
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif in_class:
+            in_class = ch != "]"
+        elif ch == "[":
+            in_class = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            return True
+    return False
+
+
+def _anchor(pattern: str) -> str:
+    """Literal every match must contain ('' when none can be derived cheaply)."""
+    prefix = _LITERAL_PREFIX.match(pattern).group(0)
+    if _has_top_level_alternation(pattern):
+        return ""
+    if pattern[len(prefix):len(prefix) + 1] in {"*", "?", "{"}:
+        prefix = prefix[:-1]  # quantified last char is optional
+    return prefix
+
+
 class RegexExcludeFilter(logging.Filter):
-    """Exclude records whose message matches any of provided regexes."""
+    """Exclude records whose message matches any of provided regexes.
+
+    Each pattern's literal prefix is checked with `in` first, so most records
+    never reach the regex engine.
+    """
 
     def __init__(self, patterns: list[str] | None = None) -> None:
         super().__init__()
-        self._res = [re.compile(p) for p in (patterns or [])]
+        self._res = [(_anchor(p), re.compile(p)) for p in (patterns or [])]
 
     def filter(self, record: logging.LogRecord) -> bool:  # noqa: D401
         try:
             msg = record.getMessage()
         except Exception:  # noqa: BLE001
             msg = str(getattr(record, "msg", ""))
-        for r in self._res:
-            if r.search(msg):
+        for anchor, r in self._res:
+            if anchor in msg and r.search(msg):
                 return False
         return True
 
@@ -88,6 +137,7 @@ def build_uvicorn_log_config() -> Dict[str, Any]:
             # Protocol noise (websockets/http), push to WARNING to suppress info chatter
             "uvicorn.asgi": {"level": "WARNING"},
             "uvicorn.protocols.http.h11_impl": {"level": "WARNING"},
+            "uvicorn.protocols.http.httptools_impl": {"level": "WARNING"},
             "uvicorn.protocols.websockets.websockets_impl": {"level": "WARNING"},
         },
     }
@@ -106,3 +156,5 @@ def apply_default_uvicorn_logging() -> None:
     except Exception:
         # Don't fail startup because of logging
         pass
+    # Drop /health records at the logger, before any handler/formatter work
+    logging.getLogger("uvicorn.access").addFilter(_HEALTH_FILTER)
@@ -4,27 +4,38 @@ By default, prints concise human-readable lines. Set env LOCALAPI_LOG_JSON=1 to
 """
 from __future__ import annotations
 
-import json
 import os
 import sys
 import time
-from typing import Any, Dict, Iterable
+from typing import Any, Callable, Dict, Iterable
+
+import orjson
 
 # Controls
 HUMAN_MIRROR = True  # always show human-readable line
 JSON_ENABLED = os.getenv("LOCALAPI_LOG_JSON", "0").strip().lower() in {"1", "true", "yes", "on"}
 
 
-def _ts() -> float:
-    return time.time()
+_now = time.time
+_PID = os.getpid()
+
+
+def _refresh_pid() -> None:
+    global _PID
+    _PID = os.getpid()
+
+
+# Forked workers get their own pid without a getpid() call per record
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_refresh_pid)
 
 
 def _base(event: str, level: str) -> Dict[str, Any]:
     return {
-        "ts": _ts(),
+        "ts": _now(),
         "level": level,
         "event": event,
-        "pid": os.getpid(),
+        "pid": _PID,
     }
 
 
@@ -36,50 +47,52 @@ def _kv(rec: Dict[str, Any], keys: list[str]) -> str:
     return " ".join(parts)
 
 
-def _maybe_pretty_echo(rec: Dict[str, Any]) -> None:
-    ev = str(rec.get("event") or rec.get("phase") or "").strip()
+# Event -> one-line human formatter; events not listed use the generic key=value fallback
+_FORMATTERS: Dict[str, Callable[[Dict[str, Any]], str]] = {
+    "llm_online": lambda r: f"[LLM] online: {r.get('base_url', '')}",
+    "llm_offline": lambda r: f"[LLM] offline: {r.get('base_url', '')}",
+    "startup": lambda r: f"[APP] started — model: {r.get('chat_model')} — base: {r.get('base_url')}",
+    "shutdown": lambda r: "[APP] stopped",
+    "llm_probe_error": lambda r: f"[LLM] probe error { _kv(r, ['attempt','latency_ms']) } base={r.get('base_url','')} err={r.get('error','')}".strip(),
+    "llm_unavailable": lambda r: f"[LLM] unavailable: {r.get('base_url','')}",
+    "context_ok": lambda r: f"[CTX] budget ok: used={r.get('tokens')}/{r.get('budget')}",
+    "context_trim": lambda r: f"[CTX] trimmed: used={r.get('tokens')}/{r.get('budget')} k={r.get('k_final')}",
+    "summary": lambda r: f"[SUM] ok { _kv(r, ['latency']) }ms",
+    "summary_error": lambda r: f"[SUM] error { _kv(r, ['latency']) }ms: {r.get('error','')}",
+    "fold_history_ok": lambda r: f"[SUM] stored length={r.get('length')}",
+    "memory_store": lambda r: f"[MEM] {r.get('key')}={r.get('value')}",
+    "final": lambda r: f"[RESP] model={r.get('model','?')} thread={str(r.get('thread_id',''))[:8]}… resp={str(r.get('response_id',''))[:8]}… {r.get('latency',0)} ms",
+}
+
+_BASE_KEYS = frozenset({"ts", "level", "event", "pid"})
+
+
+def _generic(rec: Dict[str, Any], ev: str) -> str:
+    # Generic fallback for any other JSON events
     lvl = str(rec.get("level", "INFO")).upper()
-    out = ""
-    if ev in {"llm_online", "llm_offline"}:
-        out = f"[LLM] {ev.replace('llm_', '')}: {rec.get('base_url', '')}"
-    elif ev == "startup":
-        out = f"[APP] started — model: {rec.get('chat_model')} — base: {rec.get('base_url')}"
-    elif ev == "shutdown":
-        out = "[APP] stopped"
-    elif ev == "llm_probe_error":
-        out = f"[LLM] probe error { _kv(rec, ['attempt','latency_ms']) } base={rec.get('base_url','')} err={rec.get('error','')}".strip()
-    elif ev == "llm_unavailable":
-        out = f"[LLM] unavailable: {rec.get('base_url','')}"
-    elif ev == "context_ok":
-        out = f"[CTX] budget ok: used={rec.get('tokens')}/{rec.get('budget')}"
-    elif ev == "context_trim":
-        out = f"[CTX] trimmed: used={rec.get('tokens')}/{rec.get('budget')} k={rec.get('k_final')}"
-    elif ev == "summary":
-        out = f"[SUM] ok { _kv(rec, ['latency']) }ms"
-    elif ev == "summary_error":
-        out = f"[SUM] error { _kv(rec, ['latency']) }ms: {rec.get('error','')}"
-    elif ev == "fold_history_ok":
-        out = f"[SUM] stored length={rec.get('length')}"
-    elif ev == "memory_store":
-        out = f"[MEM] {rec.get('key')}={rec.get('value')}"
-    elif ev == "final":
-        out = f"[RESP] model={rec.get('model','?')} thread={str(rec.get('thread_id',''))[:8]}… resp={str(rec.get('response_id',''))[:8]}… {rec.get('latency',0)} ms"
-    else:
-        # Generic fallback for any other JSON events
-        extras = {k: v for k, v in rec.items() if k not in {"ts", "level", "event", "pid"}}
-        tail = " ".join(f"{k}={v}" for k, v in extras.items())
-        out = f"[LOG] {lvl} {ev} {tail}".rstrip()
-    sys.stdout.write(out + "\n")
-    sys.stdout.flush()
+    tail = " ".join(f"{k}={v}" for k, v in rec.items() if k not in _BASE_KEYS)
+    return f"[LOG] {lvl} {ev} {tail}".rstrip()
+
+
+def _maybe_pretty_echo(rec: Dict[str, Any]) -> str:
+    """Human-readable line for a record (without newline)."""
+    ev = rec["event"]  # always set by _base(); log_* take it positionally
+    fmt = _FORMATTERS.get(ev)
+    return fmt(rec) if fmt else _generic(rec, ev)
 
 
 def _write(rec: Dict[str, Any]) -> None:
+    # JSON and human lines of one record go out in a single write + flush
+    parts = []
     if JSON_ENABLED:
-        # emit JSON only when enabled
-        sys.stdout.write(json.dumps(rec, ensure_ascii=False) + "\n")
-        sys.stdout.flush()
+        # emit JSON only when enabled; orjson writes UTF-8 as is, default=str keeps odd values loggable
+        parts.append(orjson.dumps(rec, default=str).decode())
     if HUMAN_MIRROR:
-        _maybe_pretty_echo(rec)
+        parts.append(_maybe_pretty_echo(rec))
+    if parts:
+        parts.append("")
+        sys.stdout.write("\n".join(parts))
+        sys.stdout.flush()
 
 
 def log_info(event: str, **kv: Any) -> None:
@@ -102,13 +115,8 @@ def log_warning(event: str, **kv: Any) -> None:
 
 def print_banner(title: str, lines: Iterable[str]) -> None:
     """Print a simple pretty banner to stdout (human-friendly)."""
-    lines = list(lines)
-    width = max(len(title), *(len(s) for s in lines), 40) + 2
+    lines = tuple(lines)
+    width = max(len(title), len(max(lines, key=len, default="")), 40) + 2
     bar = "=" * width
-    sys.stdout.write("\n" + bar + "\n")
-    sys.stdout.write(title + "\n")
-    sys.stdout.write(bar + "\n")
-    for s in lines:
-        sys.stdout.write(s + "\n")
-    sys.stdout.write(bar + "\n\n")
+    sys.stdout.write("\n".join(("", bar, title, bar, *lines, bar, "", "")))
     sys.stdout.flush()
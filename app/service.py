@@ -1,9 +1,12 @@
 """Core service orchestration for Local Responses API."""
 from __future__ import annotations
 
+import asyncio
 import json
 import time
 import uuid
+from collections import OrderedDict
+from functools import lru_cache
 import sys
 import re
 from typing import Any, AsyncIterator, Dict, List, Tuple
@@ -17,6 +20,9 @@ try:  # pragma: no cover
     from .utils_tokens import estimate_messages_tokens, estimate_tokens  # type: ignore
 except Exception:  # pragma: no cover
     def estimate_messages_tokens(messages: List[Dict[str, Any]]) -> int:  # type: ignore
+        # Fast path: plain-text contents (always the case for stored history) -> one C-level sum
+        if all(isinstance(m.get("content", ""), str) for m in messages):
+            return sum((len(m.get("content", "")) >> 2) + 2 for m in messages)
         total = 0
         for m in messages:
             c = m.get("content", "")
@@ -41,17 +47,49 @@ SYSTEM_PROMPT = (
     "You are a helpful assistant. Be concise. "
     "If you need to deliberate or outline steps, put ALL of that inside <think>…</think> and write the final answer after the tag."
 )
+# Threads whose message count is cached in memory (see LocalResponsesService._message_count)
+THREAD_COUNTS_MAX = 4096
 MEMORY_NAME_RE = re.compile(r"запомни,? что меня зовут (.+)$", re.IGNORECASE)
 
 
+@lru_cache(maxsize=256)
+def _user_facts_msg(name: str) -> str:
+    # Few distinct names, rebuilt on every trim iteration otherwise
+    return f"Факты о пользователе: имя = {name}."
+
+
 class LocalResponsesService:
     def __init__(self, db: Database, llm: LLMClient) -> None:
         self._db = db
         self._llm = llm
         self._s = get_settings()
+        # Messages per thread, seeded from one COUNT on first use and then kept up to date in memory
+        # (per process: with several workers a thread may be summarized a turn or two later).
+        # LRU-bounded: an evicted thread is simply re-counted from the DB on its next turn.
+        self._thread_counts: "OrderedDict[str, int]" = OrderedDict()
+
+    def _count_inserted(self, thread_id: str, n: int) -> None:
+        if thread_id in self._thread_counts:
+            self._thread_counts[thread_id] += n
+
+    async def _message_count(self, thread_id: str) -> int:
+        count = self._thread_counts.get(thread_id)
+        if count is None:
+            row = await self._db.fetch_one("SELECT COUNT(1) AS n FROM messages WHERE thread_id= ?", [thread_id])
+            count = self._thread_counts[thread_id] = int(row["n"]) if row else 0
+            if len(self._thread_counts) > THREAD_COUNTS_MAX:
+                self._thread_counts.popitem(last=False)
+        else:
+            self._thread_counts.move_to_end(thread_id)
+        return count
 
     async def _maybe_store_memory(self, user_text: str) -> None:
-        m = MEMORY_NAME_RE.search(user_text.strip())
+        # The pattern is anchored at the end and `.` stops at newlines, so only the last line can match
+        text = user_text.rstrip()
+        last_line = text[text.rfind("\n") + 1:]
+        if "запомни" not in last_line.lower():
+            return
+        m = MEMORY_NAME_RE.search(last_line)
         if not m:
             return
         name = m.group(1).strip().strip('.!')
@@ -60,31 +98,30 @@ class LocalResponsesService:
         await self._db.upsert_profile_kv("user.name", name)
         log_info("memory_store", key="user.name", value=name)
 
-    async def build_context(self, thread_id: str, *, k_override: int | None = None) -> List[Dict[str, str]]:
+    @staticmethod
+    def _build_context_from_parts(uname: str | None, summary: str | None, rows: List[Dict[str, Any]], k: int) -> List[Dict[str, str]]:
+        """Assemble the prompt from already-fetched parts, keeping the last `k` rows (no DB access)."""
         chat: List[Dict[str, str]] = [{"role": "system", "content": SYSTEM_PROMPT}]
-        uname = await self._db.get_profile_value("user.name")
         if uname:
-            chat.append({"role": "system", "content": f"Факты о пользователе: имя = {uname}."})
-        summary = await self._db.get_summary(thread_id)
+            chat.append({"role": "system", "content": _user_facts_msg(uname)})
         if summary:
             chat.append({"role": "system", "content": f"Thread summary: {summary}"})
-        k = k_override if k_override is not None else self._s.max_context_messages
-        recent = await self._db.get_thread_messages(thread_id, k)
-        for m in reversed(recent):
-            chat.append({"role": str(m["role"]), "content": str(m["content"])})
+        # role/content are NOT NULL TEXT columns: SQLite already hands back str
+        chat += [{"role": m["role"], "content": m["content"]} for m in (rows[-k:] if k < len(rows) else rows)]
         return chat
 
+    async def build_context(self, thread_id: str, *, k_override: int | None = None) -> List[Dict[str, str]]:
+        k = k_override if k_override is not None else self._s.max_context_messages
+        uname, summary, rows = await asyncio.gather(
+            self._db.get_profile_value("user.name"),
+            self._db.get_summary(thread_id),
+            self._db.get_thread_messages(thread_id, k),
+        )
+        return self._build_context_from_parts(uname, summary, rows, k)
+
     async def _fold_history(self, thread_id: str) -> None:
-        rows = list(reversed(await self._db.get_thread_messages(thread_id, 5000)))
-        lines: List[str] = []
-        for r in rows:
-            role = str(r.get("role", ""))
-            if role == "tool":
-                continue
-            content = str(r.get("content", "")).strip()
-            if content:
-                lines.append(f"{role}: {content}")
-        convo_text = "\n".join(lines)
+        rows = await self._db.get_thread_messages(thread_id, 5000, exclude_roles=("tool",))
+        convo_text = "\n".join(f"{r['role']}: {content}" for r in rows if (content := r["content"].strip()))
         if not convo_text:
             return
         system = "Сожми историю диалога в краткий конспект. Сохрани имена, предпочтения, задачи, факты и ссылки. Будь кратким и точным."
@@ -92,79 +129,115 @@ class LocalResponsesService:
             {"role": "system", "content": system},
             {"role": "user", "content": convo_text},
         ]
-        t0 = time.perf_counter()
+        t0 = time.perf_counter_ns()
         try:
             summary, _usage = await self._llm.chat(messages)
-            dt_ms = int((time.perf_counter() - t0) * 1000)
+            dt_ms = (time.perf_counter_ns() - t0) // 1_000_000
             log_info("summary", model=self._s.llm_model, stream=False, thread_id=thread_id, latency=dt_ms)
         except Exception as e:  # noqa: BLE001
-            dt_ms = int((time.perf_counter() - t0) * 1000)
+            dt_ms = (time.perf_counter_ns() - t0) // 1_000_000
             log_error("summary_error", model=self._s.llm_model, stream=False, thread_id=thread_id, latency=dt_ms, error=str(e)[:200])
             log_error("fold_history_error", thread_id=thread_id, error=str(e))
             return
         await self._db.upsert_summary(thread_id, summary)
         log_info("fold_history_ok", thread_id=thread_id, length=len(summary))
 
+    def _trim_to_budget(
+        self, uname: str | None, summary: str | None, rows: List[Dict[str, Any]], budget: int
+    ) -> Tuple[List[Dict[str, str]], int, int]:
+        """Shrink the history window (k *= 0.7) until the prompt fits `budget`; returns (chat, used, k).
+
+        Row token counts are measured once; each step only re-sums the kept suffix.
+        """
+        k = self._s.max_context_messages
+        header = estimate_messages_tokens(self._build_context_from_parts(uname, summary, [], k))
+        row_toks = [estimate_messages_tokens([{"content": str(r["content"])}]) for r in rows]
+        used = header + sum(row_toks[-k:])
+        while used > budget and k > 1:
+            k = max(1, int(k * 0.7))
+            used = header + sum(row_toks[-k:])
+        return self._build_context_from_parts(uname, summary, rows, k), used, k
+
     def _apply_budget(self, _tokens: int) -> int:
         return int(self._s.context_window_tokens * self._s.context_prompt_budget_ratio)
 
-    async def _ensure_budget(self, thread_id: str, *, user_text: str) -> List[Dict[str, str]]:
-        chat = await self.build_context(thread_id)
+    async def _load_context_parts(self, thread_id: str) -> Tuple[str | None, str | None, List[Dict[str, Any]]]:
+        """Profile name, summary and the last max_context_messages rows; trimming only re-slices these."""
+        # Independent reads: each leases its own pooled reader, so they run on separate threads
+        return await asyncio.gather(
+            self._db.get_profile_value("user.name"),
+            self._db.get_summary(thread_id),
+            self._db.get_thread_messages(thread_id, self._s.max_context_messages),
+        )
+
+    async def _ensure_budget(
+        self, thread_id: str, *, user_text: str, pending_msg_id: str | None = None
+    ) -> List[Dict[str, str]]:
+        """Prompt for the thread within budget; `pending_msg_id` (the already-stored current user
+        message) is left out of the history because the caller appends it itself."""
+        k = self._s.max_context_messages
+        uname, summary, rows = await self._load_context_parts(thread_id)
+        if pending_msg_id is not None:
+            rows = [r for r in rows if r["id"] != pending_msg_id]
+        chat = self._build_context_from_parts(uname, summary, rows, k)
         used = estimate_messages_tokens(chat)
         budget = self._apply_budget(used)
         if used > budget + self._s.context_hysteresis_tokens:
             await self._fold_history(thread_id)
-            chat = await self.build_context(thread_id)
+            summary = await self._db.get_summary(thread_id)
+            chat = self._build_context_from_parts(uname, summary, rows, k)
             used = estimate_messages_tokens(chat)
         if used > budget:
-            k = self._s.max_context_messages
-            while used > budget and k > 1:
-                k = max(1, int(k * 0.7))
-                chat = await self.build_context(thread_id, k_override=k)
-                used = estimate_messages_tokens(chat)
+            chat, used, k = self._trim_to_budget(uname, summary, rows, budget)
             log_info("context_trim", thread_id=thread_id, tokens=used, budget=budget, k_final=k)
         else:
             log_info("context_ok", thread_id=thread_id, tokens=used, budget=budget)
         return chat
 
+    @staticmethod
+    def _estimate_usage(messages: List[Dict[str, Any]], completion: str) -> Dict[str, int]:
+        """Fallback when the server does not report usage in the stream."""
+        prompt_tokens = estimate_messages_tokens(messages)
+        completion_tokens = estimate_tokens(completion)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
     def _log_final(self, thread_id: str, response_id: str, latency_ms: int) -> None:
         log_info("final", model=self._s.llm_model, stream=True, thread_id=thread_id, response_id=response_id, latency=latency_ms)
 
     async def _run_stream_collect(self, messages: List[Dict[str, Any]]) -> tuple[str, Dict[str, int]]:
         parts: List[str] = []
-        async for delta in self._llm.chat_stream(messages):
+        usage: Dict[str, int] = {}
+        async for delta in self._llm.chat_stream(messages, usage=usage):
             parts.append(delta)
         full_raw = "".join(parts).strip()
-        prompt_tokens = estimate_messages_tokens(messages)
-        completion_tokens = estimate_tokens(full_raw)
-        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
-        return full_raw, usage
+        return full_raw, usage or self._estimate_usage(messages, full_raw)
 
     async def respond(self, *, thread_id: str | None, previous_response_id: str | None, user_text: str, store: bool) -> Tuple[str, str, str, Dict[str, int], str]:
         actual_thread_id = await self._db.resolve_thread(previous_response_id, thread_id)
         await self._maybe_store_memory(user_text)
+        # Stored before the LLM call so a failed call does not lose the user's input
         if store:
             user_msg_id = await self._db.insert_message(actual_thread_id, "user", user_text)
+            self._count_inserted(actual_thread_id, 1)
         else:
-            user_msg_id = str(uuid.uuid4())
-        chat = await self._ensure_budget(actual_thread_id, user_text=user_text)
+            user_msg_id = uuid.uuid4().hex
+        chat = await self._ensure_budget(actual_thread_id, user_text=user_text, pending_msg_id=user_msg_id)
         chat.append({"role": "user", "content": user_text})
-        t0 = time.perf_counter()
+        t0 = time.perf_counter_ns()
         text, usage = await self._run_stream_collect(chat)
-        dt_ms = int((time.perf_counter() - t0) * 1000)
+        dt_ms = (time.perf_counter_ns() - t0) // 1_000_000
         if store:
-            assistant_msg_id = await self._db.insert_message(actual_thread_id, "assistant", text)
+            # Assistant message + response row in one transaction (single commit)
+            _assistant_msg_id, resp_id = await self._db.record_reply(actual_thread_id, user_msg_id, text, usage)
+            self._count_inserted(actual_thread_id, 1)
         else:
-            assistant_msg_id = str(uuid.uuid4())
-        resp_id = await self._db.insert_response(actual_thread_id, input_message_id=user_msg_id, status="completed", usage=usage, error=None)
-        await self._db.update_response_output(resp_id, assistant_msg_id, status="completed")
+            resp_id = await self._db.insert_response(actual_thread_id, input_message_id=user_msg_id, status="completed", usage=usage, error=None)
         self._log_final(actual_thread_id, resp_id, dt_ms)
         try:
-            row = await self._db.fetch_one("SELECT COUNT(1) AS n FROM messages WHERE thread_id= ?", [actual_thread_id])
-            count = int(row["n"]) if row else 0
-            if count >= self._s.summarize_after_messages and store:
+            if store and await self._message_count(actual_thread_id) >= self._s.summarize_after_messages:
                 from . import summarizer
-                await summarizer.summarize(actual_thread_id)
+                # Off the request path: the reply does not wait for an extra LLM call
+                summarizer.schedule(actual_thread_id)
         except Exception:
             pass
         return user_msg_id, resp_id, text, usage, actual_thread_id
@@ -172,58 +245,43 @@ class LocalResponsesService:
     async def respond_stream(self, *, user_text: str, thread_id: str | None, previous_response_id: str | None, store: bool) -> AsyncIterator[Dict[str, Any]]:
         actual_thread_id = await self._db.resolve_thread(previous_response_id, thread_id)
         await self._maybe_store_memory(user_text)
+        # Stored before streaming so an LLM error or client disconnect does not lose the input
         user_msg_id = await self._db.insert_message(actual_thread_id, "user", user_text)
-        messages = await self._ensure_budget(actual_thread_id, user_text=user_text)
+        self._count_inserted(actual_thread_id, 1)
+        messages = await self._ensure_budget(actual_thread_id, user_text=user_text, pending_msg_id=user_msg_id)
         messages.append({"role": "user", "content": user_text})
-        response_id = str(uuid.uuid4())
-        t0 = time.perf_counter()
+        response_id = uuid.uuid4().hex
+        t0 = time.perf_counter_ns()
         yield {"type": "start", "response_id": response_id, "thread_id": actual_thread_id}
-        raw_acc = ""
-        async for delta in self._llm.chat_stream(messages):
-            raw_acc += delta
+        parts: List[str] = []
+        reported: Dict[str, int] = {}
+        async for delta in self._llm.chat_stream(messages, usage=reported):
+            parts.append(delta)
             yield {"type": "delta", "text": delta}
-        prompt_tokens = estimate_messages_tokens(messages)
-        completion_tokens = estimate_tokens(raw_acc)
-        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
-        out_msg_id = await self._db.insert_message(actual_thread_id, "assistant", raw_acc)
-        await self._db.insert_response(actual_thread_id, user_msg_id, status="completed", usage=usage)
-        dt_ms = int((time.perf_counter() - t0) * 1000)
+        raw_acc = "".join(parts)
+        usage = reported or self._estimate_usage(messages, raw_acc)
+        # Same response_id as announced in the "start" frame
+        await self._db.record_reply(actual_thread_id, user_msg_id, raw_acc, usage, request_response_id=response_id)
+        self._count_inserted(actual_thread_id, 1)
+        dt_ms = (time.perf_counter_ns() - t0) // 1_000_000
         yield {"type": "end", "usage": usage}
         self._log_final(actual_thread_id, response_id, dt_ms)
 
     async def debug_context(self, thread_id: str) -> Dict[str, Any]:
-        s = self._s
-        budget = int(s.context_window_tokens * s.context_prompt_budget_ratio)
-        async def _build(k: int) -> List[Dict[str, str]]:
-            chat: List[Dict[str, str]] = [{"role": "system", "content": SYSTEM_PROMPT}]
-            uname = await self._db.get_profile_value("user.name")
-            if uname:
-                chat.append({"role": "system", "content": f"Факты о пользователе: имя = {uname}."})
-            summary = await self._db.get_summary(thread_id)
-            if summary:
-                chat.append({"role": "system", "content": f"Thread summary: {summary}"})
-            recent = await self._db.get_thread_messages(thread_id, k)
-            for m in reversed(recent):
-                chat.append({"role": str(m["role"]), "content": str(m["content"])})
-            return chat
-        k = s.max_context_messages
-        chat = await _build(k)
-        used = estimate_messages_tokens(chat)
-        if used > budget:
-            while used > budget and k > 1:
-                k = max(1, int(k * 0.7))
-                chat = await _build(k)
-                used = estimate_messages_tokens(chat)
-        summary_tokens = 0
-        for m in chat:
-            if m["role"] == "system" and m["content"].startswith("Thread summary:"):
-                summary_tokens = estimate_messages_tokens([m])
-                break
-        items: List[Dict[str, Any]] = []
-        for m in chat:
-            t = estimate_messages_tokens([m])
-            content = str(m.get("content", ""))
-            preview = content[:160] + ("…" if len(content) > 160 else "")
-            items.append({"role": m.get("role", ""), "tokens": t, "preview": preview})
+        # Same parts and trimming as _ensure_budget, minus its side effects (history folding, logs)
+        budget = self._apply_budget(0)
+        uname, summary, rows = await self._load_context_parts(thread_id)
+        chat, used, k = self._trim_to_budget(uname, summary, rows, budget)
+        # One estimate per message, reused for the summary figure and the per-item listing
+        toks = [estimate_messages_tokens([m]) for m in chat]
+        summary_tokens = next(
+            (t for m, t in zip(chat, toks) if m["role"] == "system" and m["content"].startswith("Thread summary:")),
+            0,
+        )
+        items: List[Dict[str, Any]] = [
+            {"role": m.get("role", ""), "tokens": t, "preview": c[:160] + ("…" if len(c) > 160 else "")}
+            for m, t in zip(chat, toks)
+            for c in (str(m.get("content", "")),)
+        ]
         remaining = max(0, budget - used)
         return {"thread_id": thread_id, "budget_tokens": budget, "estimated_used": used, "remaining": remaining, "summary_tokens": summary_tokens, "k_last_used": k, "messages": items}
@@ -2,13 +2,16 @@
 
 Provides async summarize(thread_id) which composes a concise thread summary
 (<= 1000 chars), stores/updates it in the DB, and returns the summary text.
+schedule(thread_id) runs it in the background (one at a time per thread);
+shutdown() cancels what is still running.
 
 Sections to cover: facts, tasks, file context, open questions.
 Tool messages are excluded from the source history.
 """
 from __future__ import annotations
 
-from typing import List, Optional
+import asyncio
+from typing import Dict, Optional
 
 from .db import Database
 from .llm_client import LLMClient
@@ -17,6 +20,8 @@ from .logging_utils import log_error, log_info
 # Module-local references to be initialized by the API on startup
 _DB: Optional[Database] = None
 _LLM: Optional[LLMClient] = None
+# Background summaries in flight, by thread (also keeps the tasks referenced until done)
+_TASKS: Dict[str, "asyncio.Task[str]"] = {}
 
 
 def init(db: Database, llm: LLMClient) -> None:
@@ -37,20 +42,9 @@ async def summarize(thread_id: str) -> str:
 
     # Collect messages (limit generously to keep token usage bounded)
     LIMIT = 500
-    rows = await _DB.get_thread_messages(thread_id, LIMIT)
-    # Reverse to chronological order and filter out tool messages
-    rows = list(reversed(rows))
-    text_lines: List[str] = []
-    for r in rows:
-        role = str(r.get("role", ""))
-        if role == "tool":
-            continue
-        content = str(r.get("content", "")).strip()
-        if not content:
-            continue
-        text_lines.append(f"[{role}] {content}")
-
-    convo = "\n".join(text_lines)
+    # Chronological order; tool messages are filtered out in SQL
+    rows = await _DB.get_thread_messages(thread_id, LIMIT, exclude_roles=("tool",))
+    convo = "\n".join(f"[{r['role']}] {content}" for r in rows if (content := r["content"].strip()))
 
     system = (
         "You are an expert meeting/minutes assistant. Summarize the conversation briefly (<= 1000 characters). "
@@ -81,3 +75,27 @@ async def summarize(thread_id: str) -> str:
     await _DB.upsert_summary(thread_id, summary)
     log_info("summary_upserted", thread_id=thread_id, length=len(summary))
     return summary
+
+
+def _on_done(thread_id: str, task: "asyncio.Task[str]") -> None:
+    _TASKS.pop(thread_id, None)
+    if not task.cancelled() and task.exception() is not None:
+        log_error("summarize_error", thread_id=thread_id, error=str(task.exception()))
+
+
+def schedule(thread_id: str) -> bool:
+    """Start summarize(thread_id) in the background unless one is already running for the thread."""
+    if thread_id in _TASKS:
+        return False
+    task = asyncio.create_task(summarize(thread_id))
+    _TASKS[thread_id] = task
+    task.add_done_callback(lambda t: _on_done(thread_id, t))
+    return True
+
+
+async def shutdown() -> None:
+    """Cancel background summaries (before the LLM client and DB are closed)."""
+    tasks = list(_TASKS.values())
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
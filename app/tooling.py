@@ -1,23 +1,28 @@
 """Tool interface, registry, and small utilities.
 
 - Tool Protocol (name, parameters_schema, async invoke)
-- VisionDescribeTool: calls LM Studio multimodal model; strict args validation
+- VisionDescribeTool: calls LM Studio multimodal model (image inlined as a data URL); strict args validation
 - list_tools(), tools_openai_format(), maybe_call_one_tool()
 - now_ts(), new_id()
+- aclose_client(): closes the shared tool HTTP client (app shutdown)
 """
 from __future__ import annotations
 
 import asyncio
+import base64
 import json
-import random
-import re
 import time
 import uuid
-from typing import Any, Dict, List, Optional, Protocol, runtime_checkable
+from collections import OrderedDict
+from contextlib import aclosing
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple, runtime_checkable
 
 import httpx
+import orjson
 
 from .config import get_settings
+from .llm_client import JSON_HEADERS, backoff_delay, build_http_client, iter_content_deltas
 from .logging_utils import log_error, log_info
 
 
@@ -28,8 +33,158 @@ __all__ = [
     "maybe_call_one_tool",
     "now_ts",
     "new_id",
+    "aclose_client",
 ]
 
+TOOL_HTTP_TIMEOUT = 60.0
+_JSON_DECODER = json.JSONDecoder()
+# Keys of the vision tool's JSON reply; an embedded object without any of them is not the reply
+VISION_RESULT_KEYS = frozenset({"summary", "objects", "detected_text", "tags"})
+# Client errors that may succeed on retry; any other 4xx fails on the first attempt
+RETRYABLE_4XX = frozenset({408, 409, 425, 429})
+
+# One pooled client for all tool calls, created on first use (tools are optional)
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = build_http_client(TOOL_HTTP_TIMEOUT)
+    return _client
+
+
+async def aclose_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+# Inlined images by URL; only responses marked immutable (our content-addressed /file/ URLs) are kept
+IMAGE_CACHE_MAX = 16
+_image_cache: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _encode_data_url(ctype: str, content: bytes) -> str:
+    return f"data:{ctype};base64,{base64.b64encode(content).decode('ascii')}"
+
+
+async def _image_data_url(url: str) -> str:
+    """Fetch an http(s) image once and inline it as a data: URL, so the LLM server does not download it.
+
+    The URL comes from the model: non-image content and bodies over max_upload_mb are rejected
+    (ValueError, reported back as the tool error) before/while reading, never buffered whole.
+    Other schemes and fetch errors pass the URL through as is.
+    """
+    if not url.startswith(("http://", "https://")):
+        return url
+    cached = _image_cache.get(url)
+    if cached is not None:
+        _image_cache.move_to_end(url)
+        return cached
+    limit_mb = get_settings().max_upload_mb
+    max_bytes = limit_mb * 1024 * 1024
+    parts: List[bytes] = []
+    try:
+        async with _get_client().stream("GET", url) as resp:
+            resp.raise_for_status()
+            ctype = resp.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+            if not ctype.startswith("image/"):
+                raise ValueError(f"image_url is not an image (content-type: {ctype or 'unknown'})")
+            declared = resp.headers.get("content-length", "")
+            if declared.isdigit() and int(declared) > max_bytes:
+                raise ValueError(f"image too large (>{limit_mb} MB)")
+            size = 0
+            async for chunk in resp.aiter_bytes():
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f"image too large (>{limit_mb} MB)")
+                parts.append(chunk)
+            cache_control = resp.headers.get("cache-control", "")
+    except httpx.HTTPError as e:
+        log_error("tool_image_fetch_error", url=url, error=str(e))
+        return url
+    content = b"".join(parts)
+    # base64 of a multi-MB image would stall the event loop
+    data_url = await asyncio.to_thread(_encode_data_url, ctype, content)
+    if "immutable" in cache_control:
+        _image_cache[url] = data_url
+        if len(_image_cache) > IMAGE_CACHE_MAX:
+            _image_cache.popitem(last=False)
+    return data_url
+
+
+async def _stream_reply(url: str, body: bytes) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Stream a chat completion; returns (text, the JSON reply object in it or None).
+
+    The reply is expected to be one JSON object: once it is complete the stream is closed, which
+    also stops the server generating any trailing prose.
+    """
+    parts: List[str] = []
+    pos = 0  # the candidate object starts at the first "{" at or after pos
+    async with _get_client().stream("POST", url, content=body, headers=JSON_HEADERS) as resp:
+        resp.raise_for_status()
+        async with aclosing(iter_content_deltas(resp)) as deltas:
+            async for delta in deltas:
+                parts.append(delta)
+                # An object can only have just completed on a closing brace
+                if "}" not in delta:
+                    continue
+                text = "".join(parts)
+                start = text.find("{", pos)
+                if start == -1:
+                    continue
+                # Only the outermost candidate is tried mid-stream: while it is incomplete, a later
+                # "{" would be one of its nested objects
+                try:
+                    obj, end = _JSON_DECODER.raw_decode(text, start)
+                except ValueError:
+                    continue
+                if isinstance(obj, dict) and not VISION_RESULT_KEYS.isdisjoint(obj):
+                    return text, obj
+                pos = end
+    # Stream ended without a clean outer object (prose braces, malformed JSON): scan the full text
+    text = "".join(parts)
+    return text, _first_json_object(text, VISION_RESULT_KEYS)
+
+
+def _as_str_list(v: Any) -> List[str]:
+    # Models almost always return lists of strings already: hand those back without copying
+    if v is None:
+        return []
+    if isinstance(v, list):
+        return v if all(type(x) is str for x in v) else [str(x) for x in v]
+    return [str(v)]
+
+
+def _is_permanent(exc: Exception) -> bool:
+    """A 4xx the server will answer the same way again (bad payload, unknown model, ...)."""
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return False
+    status = exc.response.status_code
+    return 400 <= status < 500 and status not in RETRYABLE_4XX
+
+
+def _first_json_object(text: str, keys: frozenset[str]) -> Optional[Dict[str, Any]]:
+    """Decode the first top-level `{...}` having any of `keys`, scanning in place (no regex capture).
+
+    A "{" that does not decode (prose braces, or a truncated/malformed reply) is skipped, but a
+    nested object is only accepted if it carries the expected keys: otherwise the fields of a
+    broken outer reply would be mistaken for the reply itself. None means "use the raw text".
+    """
+    idx = text.find("{")
+    while idx != -1:
+        try:
+            obj, end = _JSON_DECODER.raw_decode(text, idx)
+        except ValueError:
+            idx = text.find("{", idx + 1)
+            continue
+        if isinstance(obj, dict) and not keys.isdisjoint(obj):
+            return obj
+        idx = text.find("{", end)  # complete but foreign object: do not descend into it
+    return None
+
 
 def now_ts() -> float:
     return time.time()
@@ -48,28 +203,37 @@ class Tool(Protocol):
         ...
 
 
-def _validate_args(schema: Dict[str, Any], args: Dict[str, Any]) -> Dict[str, Any]:
-    required = schema.get("required", [])
+def _compile_validator(schema: Dict[str, Any]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """Pre-digest a tool's parameters_schema into a validator closure (schemas are static per tool).
+
+    Required keys, per-key string/enum constraints and defaults are resolved once here,
+    so each call only does the lookups the arguments actually need.
+    """
+    required = tuple(schema.get("required", []))
     props = schema.get("properties", {})
-    validated: Dict[str, Any] = {}
-    for key in required:
-        if key not in args:
-            raise ValueError(f"Missing required parameter: {key}")
-    for key, val in args.items():
-        if key not in props:
-            raise ValueError(f"Unknown parameter: {key}")
-        spec = props[key]
-        t = spec.get("type")
-        if t == "string":
-            if not isinstance(val, str):
-                raise ValueError(f"Parameter {key} must be string")
-            if "enum" in spec and val not in spec["enum"]:
-                raise ValueError(f"Parameter {key} must be one of {spec['enum']}")
-        validated[key] = val
-    for key, spec in props.items():
-        if key not in validated and "default" in spec:
-            validated[key] = spec["default"]
-    return validated
+    strings = frozenset(k for k, spec in props.items() if spec.get("type") == "string")
+    enums = {k: (frozenset(spec["enum"]), spec["enum"]) for k, spec in props.items() if "enum" in spec and k in strings}
+    defaults = tuple((k, spec["default"]) for k, spec in props.items() if "default" in spec)
+
+    def validate(args: Dict[str, Any]) -> Dict[str, Any]:
+        for key in required:
+            if key not in args:
+                raise ValueError(f"Missing required parameter: {key}")
+        for key, val in args.items():
+            if key not in props:
+                raise ValueError(f"Unknown parameter: {key}")
+            if key in strings:
+                if not isinstance(val, str):
+                    raise ValueError(f"Parameter {key} must be string")
+                allowed = enums.get(key)
+                if allowed is not None and val not in allowed[0]:
+                    raise ValueError(f"Parameter {key} must be one of {allowed[1]}")
+        validated = dict(args)
+        for key, default in defaults:
+            validated.setdefault(key, default)
+        return validated
+
+    return validate
 
 
 class VisionDescribeTool:
@@ -88,12 +252,13 @@ class VisionDescribeTool:
         "required": ["image_url"],
         "additionalProperties": False,
     }
+    _validate_args = staticmethod(_compile_validator(parameters_schema))
 
     async def invoke(self, **kwargs: Any) -> Dict[str, Any]:
         s = get_settings()
         base = s.llm_base_url.rstrip("/")
         model = s.vision_model
-        args = _validate_args(self.parameters_schema, dict(kwargs))
+        args = self._validate_args(kwargs)
         image_url = args["image_url"].strip()
         task = args.get("task", "general")
 
@@ -111,7 +276,7 @@ class VisionDescribeTool:
                 "role": "user",
                 "content": [
                     {"type": "text", "text": instruction},
-                    {"type": "image_url", "image_url": {"url": image_url}},
+                    {"type": "image_url", "image_url": {"url": await _image_data_url(image_url)}},
                 ],
             }
         ]
@@ -121,87 +286,66 @@ class VisionDescribeTool:
             "messages": messages,
             "temperature": 0,
             "max_tokens": 512,
-            "stream": False,
+            "stream": True,
         }
 
-        # network call with retries and jitter
-        max_retries = 3
-        last_err: Optional[Exception] = None
+        # network call with retries and jitter; body encoded once for all attempts
+        body = orjson.dumps(payload)
+        url = f"{base}/chat/completions"
+        # Connect failures are already retried by the transport; this loop covers timeouts and HTTP errors
+        max_retries = 2
         for attempt in range(1, max_retries + 1):
-            t0 = time.perf_counter()
+            t0 = time.perf_counter_ns()
             try:
-                async with httpx.AsyncClient(timeout=60.0) as client:
-                    resp = await client.post(f"{base}/chat/completions", json=payload)
-                    resp.raise_for_status()
-                    data = resp.json()
-                dt_ms = int((time.perf_counter() - t0) * 1000)
+                text, parsed = await _stream_reply(url, body)
+                dt_ms = (time.perf_counter_ns() - t0) // 1_000_000
                 log_info("tool_call_http", tool=self.name, model=model, latency_ms=dt_ms)
                 break
             except (httpx.TimeoutException, httpx.RequestError, httpx.HTTPStatusError) as e:
-                last_err = e
-                dt_ms = int((time.perf_counter() - t0) * 1000)
+                dt_ms = (time.perf_counter_ns() - t0) // 1_000_000
                 log_error("tool_call_http_error", tool=self.name, model=model, latency_ms=dt_ms, error=str(e))
-                if attempt >= max_retries:
+                if attempt >= max_retries or _is_permanent(e):
                     raise
-                base_wait = 0.25 * (2 ** (attempt - 1))
-                jitter = random.uniform(0, 0.15)
-                await asyncio.sleep(base_wait + jitter)
-        assert last_err is None
-
-        text = (
-            data.get("choices", [{}])[0]
-            .get("message", {})
-            .get("content")
-        ) or ""
-
-        # Try parse strict JSON, else extract the largest JSON object
-        parsed: Optional[Dict[str, Any]] = None
-        try:
-            parsed = json.loads(text)
-        except Exception:
-            match = re.search(r"\{[\s\S]*\}", text)
-            if match:
-                try:
-                    parsed = json.loads(match.group(0))
-                except Exception:
-                    parsed = None
+                await asyncio.sleep(backoff_delay(attempt))
+
         if not isinstance(parsed, dict):
-            parsed = {"summary": text.strip(), "objects": [], "detected_text": [], "tags": []}
-
-        def as_list(v: Any) -> List[str]:
-            if v is None:
-                return []
-            if isinstance(v, list):
-                return [str(x) for x in v]
-            return [str(v)]
-
-        result = {
-            "summary": str(parsed.get("summary", "")).strip(),
-            "objects": as_list(parsed.get("objects", [])),
-            "detected_text": as_list(parsed.get("detected_text", [])),
-            "tags": as_list(parsed.get("tags", [])),
+            return {"summary": text.strip(), "objects": [], "detected_text": [], "tags": []}
+
+        summary = parsed.get("summary", "")
+        return {
+            "summary": (summary if isinstance(summary, str) else str(summary)).strip(),
+            "objects": _as_str_list(parsed.get("objects")),
+            "detected_text": _as_str_list(parsed.get("detected_text")),
+            "tags": _as_str_list(parsed.get("tags")),
         }
-        return result
 
 
-def list_tools() -> List[Tool]:
-    return [VisionDescribeTool()]
+# Tools are stateless: one shared instance each, built on first use
+@lru_cache(maxsize=None)
+def list_tools() -> Tuple[Tool, ...]:
+    return (VisionDescribeTool(),)
 
 
-def tools_openai_format() -> List[Dict[str, Any]]:
-    tools: List[Dict[str, Any]] = []
-    for t in list_tools():
-        tools.append(
-            {
-                "type": "function",
-                "function": {
-                    "name": t.name,
-                    "description": f"Function tool: {t.name}",
-                    "parameters": t.parameters_schema,
-                },
-            }
-        )
-    return tools
+@lru_cache(maxsize=None)
+def _tool_map() -> Dict[str, Tool]:
+    return {t.name: t for t in list_tools()}
+
+
+# The registry is fixed at import time: build the schema once. A tuple, so callers cannot append to
+# the shared copy (orjson serializes it like a list when it goes into a request payload)
+@lru_cache(maxsize=None)
+def tools_openai_format() -> Tuple[Dict[str, Any], ...]:
+    return tuple(
+        {
+            "type": "function",
+            "function": {
+                "name": t.name,
+                "description": f"Function tool: {t.name}",
+                "parameters": t.parameters_schema,
+            },
+        }
+        for t in list_tools()
+    )
 
 
 async def maybe_call_one_tool(messages: List[Dict[str, Any]], probe_raw: Dict[str, Any]) -> tuple[List[Dict[str, Any]], bool]:
@@ -209,10 +353,9 @@ async def maybe_call_one_tool(messages: List[Dict[str, Any]], probe_raw: Dict[st
 
     Returns possibly modified messages and a flag whether a tool was called.
     """
-    try:
-        tool_calls = probe_raw.get("choices", [{}])[0].get("message", {}).get("tool_calls")
-    except Exception:
-        tool_calls = None
+    choices = probe_raw.get("choices")
+    message = choices[0].get("message") if choices else None
+    tool_calls = message.get("tool_calls") if message else None
     if not tool_calls:
         return messages, False
     call = tool_calls[0]
@@ -228,13 +371,12 @@ async def maybe_call_one_tool(messages: List[Dict[str, Any]], probe_raw: Dict[st
         args_obj = arguments
     else:
         args_obj = {}
-    tool_map = {t.name: t for t in list_tools()}
-    tool = tool_map.get(name)
+    tool = _tool_map().get(name)
     if not tool:
         return messages, False
     try:
         result = await tool.invoke(**args_obj)
     except Exception as e:  # noqa: BLE001
         result = {"error": str(e)}
-    messages = messages + [{"role": "tool", "name": name, "content": json.dumps(result, ensure_ascii=False)}]
+    messages = messages + [{"role": "tool", "name": name, "content": orjson.dumps(result).decode()}]
     return messages, True
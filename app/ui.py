@@ -1,17 +1,180 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Request
 from fastapi.responses import HTMLResponse
+import asyncio
+from collections import OrderedDict
 from pathlib import Path
+from typing import BinaryIO, Optional, Tuple
+import os
 import secrets
 import hashlib
 
 from .logging_utils import log_error, log_info
-from .config import settings
+from .config import get_settings
 
 router = APIRouter(tags=["ui"])
 
+settings = get_settings()
+
 BASE_FILES = Path(settings.files_dir).resolve()
 BASE_FILES.mkdir(parents=True, exist_ok=True)
 
+# Static page (no templating): read once at import instead of on every GET /
+INDEX_HTML = (Path(__file__).parent / "templates" / "index.html").read_text(encoding="utf-8")
+
+
+# Each UploadFile.read() is a threadpool hop (spooled temp file): read in large chunks
+UPLOAD_CHUNK = 4 * 1024 * 1024
+
+# Dedup probe: hash of an upload's first bytes -> stored file starting with them (per process, LRU-bounded).
+# A hit is only a candidate: the upload is compared byte for byte and written out as soon as it differs.
+DEDUP_PROBE_BYTES = 64 * 1024
+# Multipart framing around the single file part (boundaries, part headers); Content-Length includes it
+MULTIPART_OVERHEAD_MAX = 64 * 1024
+DEDUP_INDEX_MAX = 1024
+_dedup_index: "OrderedDict[bytes, Path]" = OrderedDict()
+
+
+def _probe_key(suffix: str, head: bytes) -> bytes:
+    h = hashlib.blake2b(suffix.encode(), digest_size=16)
+    h.update(head[:DEDUP_PROBE_BYTES])
+    return h.digest()
+
+
+def _open_candidate(key: bytes) -> Optional[BinaryIO]:
+    path = _dedup_index.get(key)
+    if path is None:
+        return None
+    try:
+        return path.open("rb")
+    except OSError:
+        _dedup_index.pop(key, None)
+        return None
+
+
+def _remember(key: bytes, path: Path) -> None:
+    _dedup_index[key] = path
+    _dedup_index.move_to_end(key)
+    if len(_dedup_index) > DEDUP_INDEX_MAX:
+        _dedup_index.popitem(last=False)
+
+
+def _copy_prefix(src: BinaryIO, out: BinaryIO, n: int) -> None:
+    """Write the first n bytes of src (already matched by the upload) to out."""
+    src.seek(0)
+    while n:
+        buf = src.read(min(n, UPLOAD_CHUNK))
+        if not buf:
+            raise OSError("stored file shrank during upload")
+        out.write(buf)
+        n -= len(buf)
+
+
+# Linux: unnamed temp file in BASE_FILES, linked under its final name once complete. Support is
+# found out on the first upload and the flag cleared if the open or the /proc link is refused
+_O_TMPFILE = getattr(os, "O_TMPFILE", 0)
+_O_BINARY = getattr(os, "O_BINARY", 0)
+
+
+def _open_named(tmp: Path) -> int:
+    # Exclusive create; unbuffered writes below because every write is already a whole chunk.
+    # O_BINARY (Windows only, as in tempfile): a text-mode fd would turn LF into CRLF
+    return os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | _O_BINARY, 0o644)
+
+
+def _create_upload_file(tmp: Path) -> Tuple[int, bool]:
+    """Open the upload target: (fd, anonymous). Falls back to the named `tmp` path."""
+    global _O_TMPFILE
+    if _O_TMPFILE:
+        try:
+            # Read access so the data can still be copied out if linking turns out to be refused
+            return os.open(BASE_FILES, _O_TMPFILE | os.O_RDWR, 0o644), True
+        except OSError:
+            _O_TMPFILE = 0  # filesystem without O_TMPFILE support
+    return _open_named(tmp), False
+
+
+def _link_anonymous(fd: int, final_path: Path) -> Optional[bool]:
+    """Name an O_TMPFILE upload (fd must still be open); returns True if the file already existed.
+
+    Returns None if linking is refused (no /proc, or a filesystem/sandbox rejecting it); later
+    uploads then use named temp files.
+    """
+    global _O_TMPFILE
+    try:
+        os.link(f"/proc/self/fd/{fd}", final_path, follow_symlinks=True)
+    except FileExistsError:
+        return True
+    except OSError:
+        _O_TMPFILE = 0
+        return None
+    return False
+
+
+def _copy_to_named(fd: int, tmp: Path) -> None:
+    """Copy a finished anonymous upload into the named `tmp` path (fallback when linking fails)."""
+    with os.fdopen(_open_named(tmp), "wb") as dst:
+        offset = 0
+        while chunk := os.pread(fd, UPLOAD_CHUNK, offset):
+            dst.write(chunk)
+            offset += len(chunk)
+
+
+def _publish_named(tmp: Path, final_path: Path) -> bool:
+    """Move a closed named upload into place; returns True if the file already existed.
+
+    Must run after the descriptor is closed: Windows refuses to rename or delete an open file.
+    """
+    if final_path.exists():
+        tmp.unlink(missing_ok=True)
+        return True
+    tmp.replace(final_path)
+    return False
+
+
+class _UploadSink:
+    """Hashes one upload and writes it out, skipping the bytes that match a dedup candidate.
+
+    feed()/finish() block on hashing and disk I/O: run them via asyncio.to_thread, one at a time.
+    """
+
+    def __init__(self, out: BinaryIO, ref: Optional[BinaryIO]) -> None:
+        self._out = out
+        self._ref = ref  # stored candidate while the upload still matches it
+        self._matched = 0
+        self._hash = hashlib.sha256()
+
+    def feed(self, chunk: bytes) -> None:
+        self._hash.update(chunk)
+        if self._ref is not None:
+            if self._ref.read(len(chunk)) == chunk:
+                self._matched += len(chunk)
+                return  # duplicate so far: nothing to write
+            _copy_prefix(self._ref, self._out, self._matched)
+            self.close()
+        self._out.write(chunk)
+
+    def finish(self) -> str:
+        """Return the SHA-256 hex digest.
+
+        If the whole upload matched the candidate nothing has been written: the candidate stays open
+        so fill() can still materialize the bytes (see ui_upload) and the written file is empty.
+        """
+        if self._ref is not None and self._ref.read(1):
+            # Upload is a strict prefix of the candidate: write that prefix out
+            self.fill()
+        return self._hash.hexdigest()
+
+    def fill(self) -> None:
+        """Write the bytes that matched the candidate (and were skipped) to the output file."""
+        if self._ref is not None:
+            _copy_prefix(self._ref, self._out, self._matched)
+            self.close()
+
+    def close(self) -> None:
+        if self._ref is not None:
+            self._ref.close()
+            self._ref = None
+
 
 def _is_allowed_mime(mime: str) -> bool:
     if not mime:
@@ -30,36 +193,67 @@ async def ui_upload(file: UploadFile = File(...), request: Request = None):
         raise HTTPException(400, f"unsupported mime: {file.content_type}")
 
     max_bytes = settings.max_upload_mb * 1024 * 1024
-    h = hashlib.sha256()
+    # Declared body size settles obvious oversize uploads before any temp file or hashing
+    content_length = request.headers.get("content-length") if request is not None else None
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD_MAX:
+        raise HTTPException(413, f"file too large (>{settings.max_upload_mb} MB)")
     tmp = (BASE_FILES / f".upload-{secrets.token_hex(8)}{suffix}").resolve()
     if BASE_FILES not in tmp.parents:
         raise HTTPException(400, "bad path")
 
     size = 0
+    key: Optional[bytes] = None
+    sink: Optional[_UploadSink] = None
+    anonymous = False
+    published = False
     try:
-        with tmp.open("wb") as out:
+        fd, anonymous = _create_upload_file(tmp)
+        with os.fdopen(fd, "wb", buffering=0) as out:
             while True:
-                chunk = await file.read(1024 * 1024)
+                chunk = await file.read(UPLOAD_CHUNK)
                 if not chunk:
                     break
                 size += len(chunk)
                 if size > max_bytes:
-                    out.close()
-                    tmp.unlink(missing_ok=True)
                     raise HTTPException(413, f"file too large (>{settings.max_upload_mb} MB)")
-                h.update(chunk)
-                out.write(chunk)
-        digest = h.hexdigest()
-        final_path = (BASE_FILES / f"{digest}{suffix}").resolve()
-        if BASE_FILES not in final_path.parents:
-            tmp.unlink(missing_ok=True)
-            raise HTTPException(400, "bad path")
-        if final_path.exists():
-            tmp.unlink(missing_ok=True)
-            exists = True
-        else:
-            tmp.replace(final_path)
-            exists = False
+                if sink is None:
+                    # Dedup index is only touched here, on the event loop
+                    key = _probe_key(suffix, chunk)
+                    sink = _UploadSink(out, _open_candidate(key))
+                # Hash + compare + write of a whole chunk: keep the loop free for streaming responses
+                await asyncio.to_thread(sink.feed, chunk)
+            if sink is None:
+                sink = _UploadSink(out, None)  # empty upload
+            digest = await asyncio.to_thread(sink.finish)
+            final_path = (BASE_FILES / f"{digest}{suffix}").resolve()
+            if BASE_FILES not in final_path.parents:
+                raise HTTPException(400, "bad path")
+            # A full dedup match wrote nothing. Reuse the stored copy if it is still there, else write
+            # the bytes now: a short file must never be published under its immutable name
+            reused = False
+            if os.fstat(fd).st_size != size:
+                if final_path.exists():
+                    reused = True
+                else:
+                    await asyncio.to_thread(sink.fill)
+                    if os.fstat(fd).st_size != size:
+                        raise OSError("upload size mismatch after dedup fill")
+            sink.close()
+            if anonymous and not reused:
+                # Anonymous files can only be linked while the descriptor is still open
+                exists = _link_anonymous(fd, final_path)
+                if exists is None:
+                    anonymous = False  # published by name below, cleaned up in finally otherwise
+                    await asyncio.to_thread(_copy_to_named, fd, tmp)
+                else:
+                    published = True
+        if reused:
+            exists = True  # the unused temp file goes away on close (anonymous) or in finally (named)
+        elif not anonymous:
+            exists = _publish_named(tmp, final_path)
+            published = True
+        if key is not None:
+            _remember(key, final_path)
         log_info("ui_upload", size=size, mime=file.content_type, name=final_path.name, status="ok", dedup=exists)
         # Prefer request.base_url to generate URL behind reverse proxies; fallback to settings.app_base_url
         try:
@@ -72,11 +266,15 @@ async def ui_upload(file: UploadFile = File(...), request: Request = None):
         raise
     except Exception as e:  # noqa: BLE001
         log_error("ui_upload_error", error=str(e))
-        tmp.unlink(missing_ok=True)
         raise HTTPException(500, "internal error")
+    finally:
+        if sink is not None:
+            sink.close()
+        # An anonymous file is reclaimed by the kernel when its descriptor closes; a named one must go
+        if not published and not anonymous:
+            tmp.unlink(missing_ok=True)
 
 
 @router.get("/", response_class=HTMLResponse)
 async def ui_index():
-    html = (Path(__file__).parent / "templates" / "index.html").read_text(encoding="utf-8")
-    return HTMLResponse(html)
+    return HTMLResponse(INDEX_HTML)
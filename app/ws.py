@@ -2,9 +2,10 @@ from __future__ import annotations
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from typing import Any
-import json
 import uuid
 
+import orjson
+
 from .service import LocalResponsesService
 
 router = APIRouter()
@@ -14,8 +15,12 @@ router = APIRouter()
 async def ws_respond(ws: WebSocket) -> None:
     await ws.accept()
     try:
-        init = await ws.receive_text()
-        req = json.loads(init)
+        # Init frame may be text or binary; orjson parses either without an extra decode/encode
+        msg = await ws.receive()
+        if msg["type"] == "websocket.disconnect":
+            return
+        init = msg.get("bytes") or msg.get("text") or b""
+        req = orjson.loads(init)
         service: LocalResponsesService = ws.app.state.service  # injected on startup
         async for frame in service.respond_stream(
             user_text=str(req.get("input_text", "")),
@@ -23,12 +28,13 @@ async def ws_respond(ws: WebSocket) -> None:
             previous_response_id=req.get("previous_response_id"),
             store=bool(req.get("store", True)),
         ):
-            await ws.send_text(json.dumps(frame, ensure_ascii=False))
+            # Text frames: the browser client JSON.parse()s event.data (a binary frame would arrive as a Blob)
+            await ws.send_text(orjson.dumps(frame).decode())
     except WebSocketDisconnect:
         return
     except Exception:
         trace_id = str(uuid.uuid4())
-        await ws.send_text(json.dumps({"type": "error", "message": "internal error", "trace_id": trace_id}, ensure_ascii=False))
+        await ws.send_text(orjson.dumps({"type": "error", "message": "internal error", "trace_id": trace_id}).decode())
     finally:
         try:
             await ws.close()
@@ -1,10 +1,11 @@
 -- Schema for Local Responses API skeleton
+-- created_at columns hold Unix time in nanoseconds (time.time_ns())
 
 PRAGMA foreign_keys=ON;
 
 CREATE TABLE IF NOT EXISTS threads (
     id TEXT PRIMARY KEY,
-    created_at REAL NOT NULL
+    created_at INTEGER NOT NULL
 );
 
 CREATE TABLE IF NOT EXISTS messages (
@@ -12,11 +13,13 @@ CREATE TABLE IF NOT EXISTS messages (
     thread_id TEXT NOT NULL,
     role TEXT NOT NULL CHECK(role IN ('user','assistant','system','tool')),
     content TEXT NOT NULL,
-    created_at REAL NOT NULL,
+    created_at INTEGER NOT NULL,
     token_count INTEGER DEFAULT 0,
     FOREIGN KEY(thread_id) REFERENCES threads(id) ON DELETE CASCADE
 );
 
+-- Serves get_thread_messages (thread_id = ? ORDER BY created_at DESC LIMIT ?) via a reverse index scan
+-- and COUNT(1) per thread as a covering index. Not widened with content: that would duplicate every message body.
 CREATE INDEX IF NOT EXISTS idx_messages_thread_created ON messages(thread_id, created_at);
 
 CREATE TABLE IF NOT EXISTS responses (
@@ -25,9 +28,12 @@ CREATE TABLE IF NOT EXISTS responses (
     request_message_id TEXT,
     response_message_id TEXT,
     status TEXT NOT NULL DEFAULT 'completed',
-    usage_json TEXT,
+    usage_json TEXT,  -- legacy: token counts now live in the INTEGER columns below
     error_text TEXT,
-    created_at REAL NOT NULL,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    created_at INTEGER NOT NULL,
     FOREIGN KEY(thread_id) REFERENCES threads(id) ON DELETE CASCADE
 );
 
@@ -35,8 +41,9 @@ CREATE INDEX IF NOT EXISTS idx_responses_thread_created ON responses(thread_id,
 
 CREATE TABLE IF NOT EXISTS summaries (
     thread_id TEXT PRIMARY KEY,
-    content TEXT NOT NULL,
-    created_at REAL NOT NULL,
+    content TEXT NOT NULL,  -- legacy plain text; new rows leave it empty and use content_zstd
+    created_at INTEGER NOT NULL,
+    content_zstd BLOB,  -- 1 version byte (0 = raw UTF-8, 1 = zstd) + payload
     FOREIGN KEY(thread_id) REFERENCES threads(id) ON DELETE CASCADE
 );
 
@@ -45,7 +52,8 @@ CREATE TABLE IF NOT EXISTS profiles (
     id TEXT PRIMARY KEY,
     name TEXT NOT NULL UNIQUE,
     settings_json TEXT NOT NULL,
-    created_at REAL NOT NULL
+    created_at INTEGER NOT NULL
 );
 
-CREATE INDEX IF NOT EXISTS idx_profiles_name ON profiles(name);
+-- name UNIQUE already creates an index; a second one only costs writes
+DROP INDEX IF EXISTS idx_profiles_name;